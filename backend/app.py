@@ -3,21 +3,74 @@ Vibe Fitness Backend API
 Provides AI-powered diet planning, workout generation, and personalized recommendations
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-from diet_ai import diet_generator
-from workout_ai import workout_generator
+from catalog import CatalogRecord, build_stale_catalogs
+from diet_ai import DIET_REQUIRED_FIELDS, MAX_PLAN_DAYS, diet_generator, variety_error
+from energy import measurement_error
+from workout_ai import MAX_PROGRAM_WEEKS, PROGRAM_WEEKS, WORKOUT_REQUIRED_FIELDS, workout_generator
+from macro_tree import MACRO_AXES
+from meal_optimizer import NUTRIENTS
+from meal_store import is_meal_id, json_number, macro_percentages, sum_nutrients
+from payloads import encode_json, etag_for, splice_object
+from plan_cache import PlanCache, list_field_error
 from datetime import datetime
+import base64
+import json
 import logging
+import math
+
+class CatalogJSONProvider(DefaultJSONProvider):
+    """JSON provider that also encodes immutable catalog records"""
+    
+    @staticmethod
+    def default(o):
+        if isinstance(o, CatalogRecord):
+            return dict(o)
+        return DefaultJSONProvider.default(o)
 
 # Initialize Flask app
 app = Flask(__name__)
+app.json = CatalogJSONProvider(app)
 CORS(app)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Meal search page sizes
+DEFAULT_SEARCH_LIMIT = 50
+MAX_SEARCH_LIMIT = 500
+
+# Similar meals returned per request
+DEFAULT_SIMILAR_MEALS = 5
+MAX_SIMILAR_MEALS = 50
+
+# Most meal-sets one nutrition request may total
+MAX_NUTRITION_MEAL_SETS = 10000
+
+# Most exercise names one alternatives request may look up
+MAX_ALTERNATIVE_EXERCISES = 500
+
+# Most diet plan requests share a handful of profile shapes
+diet_plan_cache = PlanCache(maxsize=256, ttl=600)
+
+# Workout plans only vary by template, goal, conditions and program window, so few keys cover most requests
+workout_plan_cache = PlanCache(maxsize=128, ttl=3600)
+
+# The dev server is a single process, so it compiles stale catalogs itself; deployed workers expect `python catalog.py` to have run
+if __name__ == '__main__':
+    for compiled_path in build_stale_catalogs():
+        logger.info(f"Compiled {compiled_path}")
+
+# Open the meal catalog now, so a missing or stale compiled file stops the worker before it takes requests
+diet_generator.meal_index
+
+# Workout templates are joined against the exercise catalog once; report any gaps at startup
+for template_key, missing_exercises in workout_generator.missing_template_exercises().items():
+    logger.warning(f"Workout template {template_key} names exercises missing from the catalog: {', '.join(missing_exercises)}")
+
 # Health check endpoint
 @app.route('/api/health', methods=['GET'])
 def health():
@@ -29,46 +82,84 @@ def health():
         "cors": "enabled"
     }), 200
 
+# API description, encoded once since it never changes
+API_INFO = {
+    "service": "Vibe Fitness Backend API",
+    "version": "1.0.0",
+    "endpoints": {
+        "POST /api/diet-plan": {
+            "description": "Generate personalized 7-day diet plan",
+            "query_parameters": {
+                "days": "Plan length in days (1-366, default 7)",
+                "stream": "Set to 1 to stream the plan as NDJSON records"
+            },
+            "required_fields": ["goal", "weight", "height", "age"],
+            "optional_fields": [
+                "gender", "activityLevel", "medicalConditions", "dietaryRestrictions", "targetCalories",
+                "varietyWindow", "varietySeed"
+            ],
+            "example": {
+                "height": 180,
+                "weight": 75,
+                "age": 25,
+                "gender": "male",
+                "activityLevel": "moderate",
+                "goal": "cutting",
+                "medicalConditions": [],
+                "dietaryRestrictions": [],
+                "targetCalories": 2000
+            }
+        },
+        "POST /api/workout-plan": {
+            "description": "Generate personalized 8-week workout plan",
+            "query_parameters": {
+                "startWeek": f"First program week to expand (1-{MAX_PROGRAM_WEEKS}, default 1)",
+                "weeks": f"Program weeks to expand (default {PROGRAM_WEEKS}); the 8-week cycle repeats",
+                "stream": "Set to 1 to stream the plan as NDJSON records, one per week"
+            },
+            "required_fields": ["goal", "fitnessExperience"],
+            "optional_fields": ["weight", "height", "age", "medicalConditions", "daysAvailable"],
+            "example": {
+                "goal": "muscle_gain",
+                "fitnessExperience": "intermediate",
+                "weight": 75,
+                "height": 180,
+                "age": 25,
+                "medicalConditions": [],
+                "daysAvailable": 4
+            }
+        },
+        "GET /api/meal-search": {
+            "description": "Search one meal category, one page at a time",
+            "query_parameters": {
+                "type": "Meal category (default breakfast)",
+                "tags": "Comma-separated suitableFor tags",
+                "match": "all (default) or any, for tags",
+                "minCalories / maxCalories": "Range filters; also Protein, Carbs and Fats",
+                "limit": f"Page size (1-{MAX_SEARCH_LIMIT}, default {DEFAULT_SEARCH_LIMIT})",
+                "cursor": "nextCursor from the previous page",
+                "fields": "Comma-separated fields to return, e.g. id,name,calories"
+            }
+        },
+        "POST /api/exercise-alternatives": {
+            "description": "Look up the alternatives of many exercises at once",
+            "required_fields": ["exercises"],
+            "example": {
+                "exercises": ["Bench Press", "squats", "Deadlifts"]
+            }
+        }
+    }
+}
+API_INFO_BODY = encode_json(API_INFO) + b"\n"
+API_INFO_ETAG = etag_for(API_INFO_BODY)
+
 # API Info endpoint
 @app.route('/api/info', methods=['GET'])
 def api_info():
     """Show API information and expected request format"""
-    return jsonify({
-        "service": "Vibe Fitness Backend API",
-        "version": "1.0.0",
-        "endpoints": {
-            "POST /api/diet-plan": {
-                "description": "Generate personalized 7-day diet plan",
-                "required_fields": ["goal", "weight", "height", "age"],
-                "optional_fields": ["gender", "activityLevel", "medicalConditions", "dietaryRestrictions", "targetCalories"],
-                "example": {
-                    "height": 180,
-                    "weight": 75,
-                    "age": 25,
-                    "gender": "male",
-                    "activityLevel": "moderate",
-                    "goal": "cutting",
-                    "medicalConditions": [],
-                    "dietaryRestrictions": [],
-                    "targetCalories": 2000
-                }
-            },
-            "POST /api/workout-plan": {
-                "description": "Generate personalized 8-week workout plan",
-                "required_fields": ["goal", "fitnessExperience"],
-                "optional_fields": ["weight", "height", "age", "medicalConditions", "daysAvailable"],
-                "example": {
-                    "goal": "muscle_gain",
-                    "fitnessExperience": "intermediate",
-                    "weight": 75,
-                    "height": 180,
-                    "age": 25,
-                    "medicalConditions": [],
-                    "daysAvailable": 4
-                }
-            }
-        }
-    }), 200
+    response = Response(API_INFO_BODY, mimetype='application/json')
+    response.set_etag(API_INFO_ETAG)
+    return response.make_conditional(request)
 
 
 # Diet plan generation endpoint
@@ -80,7 +171,7 @@ def generate_diet_plan():
         logger.info(f"Received diet plan request: {user_profile}")
         
         # Validate required fields
-        required_fields = ['goal', 'weight', 'height', 'age']
+        required_fields = DIET_REQUIRED_FIELDS
         missing_fields = [field for field in required_fields if field not in user_profile]
         if missing_fields:
             logger.error(f"Missing required fields: {missing_fields}")
@@ -90,17 +181,42 @@ def generate_diet_plan():
                 "received": list(user_profile.keys())
             }), 400
         
+        days = request.args.get('days', 7, type=int)
+        if not 1 <= days <= MAX_PLAN_DAYS:
+            return jsonify({
+                "error": f"days must be between 1 and {MAX_PLAN_DAYS}"
+            }), 400
+        
+        error = list_field_error(user_profile) or measurement_error(user_profile) or variety_error(user_profile)
+        if error:
+            return jsonify({"error": error}), 400
+        
+        # Long horizons can be streamed as NDJSON, one record per line
+        if request.args.get('stream') in ('1', 'true'):
+            logger.info(f"Streaming {days}-day meal plan...")
+            return Response(
+                stream_records(diet_generator.iter_meal_plan(user_profile, days=days), "Failed to generate diet plan"),
+                mimetype='application/x-ndjson'
+            )
+        
         # Generate meal plan
         logger.info("Generating meal plan...")
-        meal_plan = diet_generator.generate_meal_plan(user_profile, days=7)
+        cache_key = diet_generator.plan_cache_key(user_profile, days=days)
+        plan_payload = diet_plan_cache.get(cache_key)
+        if plan_payload is None:
+            plan_payload = diet_generator.generate_plan_payload(user_profile, days=days)
+            diet_plan_cache.put(cache_key, plan_payload)
+        else:
+            logger.info("Serving diet plan from cache")
         
         logger.info(f"Successfully generated diet plan for user: {user_profile.get('gender', 'unknown')}")
         
-        return jsonify({
-            "success": True,
-            "data": meal_plan,
-            "generated_at": datetime.now().isoformat()
-        }), 200
+        # Meals arrive pre-encoded, so the response is assembled from bytes rather than jsonify'd
+        return Response(splice_object({
+            "success": b"true",
+            "data": diet_generator.render_plan(plan_payload, user_profile),
+            "generated_at": encode_json(datetime.now().isoformat())
+        }) + b"\n", mimetype='application/json')
         
     except Exception as e:
         logger.error(f"Error generating diet plan: {str(e)}", exc_info=True)
@@ -109,6 +225,16 @@ def generate_diet_plan():
             "details": str(e)
         }), 500
 
+def stream_records(records, failure):
+    """Serialise a streamed plan's records as NDJSON lines"""
+    try:
+        for record in records:
+            yield json.dumps(record) + "\n"
+    except Exception as e:
+        # Headers are already sent, so report the failure in-band
+        logger.error(f"Error streaming plan: {str(e)}", exc_info=True)
+        yield json.dumps({"record": "error", "error": failure, "details": str(e)}) + "\n"
+
 # Workout plan generation endpoint
 @app.route('/api/workout-plan', methods=['POST'])
 def generate_workout_plan():
@@ -118,7 +244,7 @@ def generate_workout_plan():
         logger.info(f"Received workout plan request: {user_profile}")
         
         # Validate required fields
-        required_fields = ['goal', 'fitnessExperience']
+        required_fields = WORKOUT_REQUIRED_FIELDS
         missing_fields = [field for field in required_fields if field not in user_profile]
         if missing_fields:
             logger.error(f"Missing required fields: {missing_fields}")
@@ -128,17 +254,45 @@ def generate_workout_plan():
                 "received": list(user_profile.keys())
             }), 400
         
+        start_week = request.args.get('startWeek', 1, type=int)
+        weeks = request.args.get('weeks', PROGRAM_WEEKS, type=int)
+        if not 1 <= start_week <= MAX_PROGRAM_WEEKS or not 1 <= weeks <= MAX_PROGRAM_WEEKS - start_week + 1:
+            return jsonify({
+                "error": f"startWeek and weeks must select weeks within 1-{MAX_PROGRAM_WEEKS}"
+            }), 400
+        
+        error = list_field_error(user_profile, ("medicalConditions",))
+        if error:
+            return jsonify({"error": error}), 400
+        
+        # Program weeks are expanded lazily, so a long window can be streamed week by week
+        if request.args.get('stream') in ('1', 'true'):
+            logger.info(f"Streaming {weeks}-week workout program...")
+            return Response(
+                stream_records(
+                    workout_generator.iter_workout_plan(user_profile, start_week, weeks),
+                    "Failed to generate workout plan"
+                ),
+                mimetype='application/x-ndjson'
+            )
+        
         # Generate workout plan
         logger.info("Generating workout plan...")
-        plan = workout_generator.generate_workout_plan(user_profile)
+        cache_key = workout_generator.plan_cache_key(user_profile, start_week, weeks)
+        plan_payload = workout_plan_cache.get(cache_key)
+        if plan_payload is None:
+            plan_payload = workout_generator.generate_plan_payload(user_profile, start_week, weeks)
+            workout_plan_cache.put(cache_key, plan_payload)
+        else:
+            logger.info("Serving workout plan from cache")
         
         logger.info(f"Successfully generated workout plan for goal: {user_profile.get('goal', 'unknown')}")
         
-        return jsonify({
-            "success": True,
-            "data": plan,
-            "generated_at": datetime.now().isoformat()
-        }), 200
+        return Response(splice_object({
+            "success": b"true",
+            "data": workout_generator.render_plan(plan_payload, user_profile),
+            "generated_at": encode_json(datetime.now().isoformat())
+        }) + b"\n", mimetype='application/json')
         
     except Exception as e:
         logger.error(f"Error generating workout plan: {str(e)}", exc_info=True)
@@ -147,6 +301,18 @@ def generate_workout_plan():
             "details": str(e)
         }), 500
 
+# Cache statistics endpoint
+@app.route('/api/cache-stats', methods=['GET'])
+def cache_stats():
+    """Report plan cache counters for sizing"""
+    return jsonify({
+        "success": True,
+        "caches": {
+            "dietPlan": diet_plan_cache.stats(),
+            "workoutPlan": workout_plan_cache.stats()
+        }
+    }), 200
+
 # AI recommendations endpoint
 @app.route('/api/recommendations', methods=['POST'])
 def get_recommendations():
@@ -154,16 +320,27 @@ def get_recommendations():
     try:
         user_profile = request.json
         
+        error = measurement_error(user_profile)
+        if error:
+            return jsonify({"error": error}), 400
+        
         # Generate recommendations
-        recommendations = diet_generator.generate_ai_recommendations(user_profile)
+        recommendations = diet_generator.recommendations_json(user_profile)
         
         logger.info("Generated personalized recommendations")
         
-        return jsonify({
-            "success": True,
-            "data": recommendations,
-            "generated_at": datetime.now().isoformat()
-        }), 200
+        # Bodies differ only in generated_at, so a weak tag over the data lets clients skip unchanged ones
+        etag = etag_for(recommendations)
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+        else:
+            response = Response(splice_object({
+                "success": b"true",
+                "data": recommendations,
+                "generated_at": encode_json(datetime.now().isoformat())
+            }) + b"\n", mimetype='application/json')
+        response.set_etag(etag, weak=True)
+        return response
         
     except Exception as e:
         logger.error(f"Error generating recommendations: {str(e)}")
@@ -175,28 +352,60 @@ def get_recommendations():
 # Meal search endpoint
 @app.route('/api/meal-search', methods=['GET'])
 def search_meals():
-    """Search meals by criteria"""
+    """Search meals by tags and macro ranges, one page at a time"""
     try:
         meal_type = request.args.get('type', 'breakfast')
-        dietary_restriction = request.args.get('restriction', None)
         
-        if meal_type not in diet_generator.meal_database:
+        if meal_type not in diet_generator.meal_index:
             return jsonify({
                 "error": "Invalid meal type",
                 "valid_types": list(diet_generator.meal_database.keys())
             }), 400
         
-        meals = diet_generator.meal_database[meal_type]
+        index = diet_generator.meal_index[meal_type]
+        
+        # Tags: `tags=a,b` matched with `match=all|any`; the single `restriction` tag still works
+        tags = [tag for tag in request.args.get('tags', '').split(',') if tag]
+        if request.args.get('restriction'):
+            tags.append(request.args['restriction'])
+        match = request.args.get('match', 'all')
+        if match not in ('all', 'any'):
+            return jsonify({"error": "match must be 'all' or 'any'"}), 400
+        mask = index.any_of(tags) if tags and match == 'any' else index.all_of(tags)
+        
+        # Macro ranges, e.g. minProtein=20&maxCalories=400
+        for field in NUTRIENTS:
+            suffix = field.capitalize()
+            bounds = {}
+            for name in (f'min{suffix}', f'max{suffix}'):
+                if name in request.args:
+                    bounds[name] = parse_range_bound(request.args[name])
+                    if bounds[name] is None:
+                        return jsonify({"error": f"{name} must be a number"}), 400
+            if bounds:
+                mask &= index.range_mask(field, bounds.get(f'min{suffix}'), bounds.get(f'max{suffix}'))
+        
+        limit = request.args.get('limit', DEFAULT_SEARCH_LIMIT, type=int)
+        if not 1 <= limit <= MAX_SEARCH_LIMIT:
+            return jsonify({"error": f"limit must be between 1 and {MAX_SEARCH_LIMIT}"}), 400
         
-        # Filter by dietary restriction if provided
-        if dietary_restriction:
-            meals = [m for m in meals if dietary_restriction in m.get('suitableFor', [])]
+        start = 0
+        if request.args.get('cursor'):
+            start = decode_search_cursor(request.args['cursor'], meal_type)
+            if start is None:
+                return jsonify({"error": "Invalid cursor"}), 400
+        
+        fields = [field for field in request.args.get('fields', '').split(',') if field] or None
+        positions, next_start = index.page(mask, start, limit)
+        meals = index.records(positions, fields)
         
         return jsonify({
             "success": True,
             "mealType": meal_type,
             "count": len(meals),
-            "meals": meals
+            "total": mask.bit_count(),
+            "meals": meals,
+            "nextCursor": None if next_start is None else encode_search_cursor(meal_type, next_start)
         }), 200
         
     except Exception as e:
@@ -206,35 +415,142 @@ def search_meals():
             "details": str(e)
         }), 500
 
+def parse_range_bound(value):
+    """Parse a macro range bound from the query string, or None if it is not a finite number"""
+    try:
+        bound = float(value)
+    except ValueError:
+        return None
+    return bound if math.isfinite(bound) else None
+
+def encode_search_cursor(meal_type, position):
+    """Encode where the next page of a meal search starts"""
+    return base64.urlsafe_b64encode(f"{meal_type}:{position}".encode()).decode()
+
+def decode_search_cursor(cursor, meal_type):
+    """Decode a meal search cursor, or None if it is malformed or for another meal type"""
+    try:
+        cursor_type, position = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit(':', 1)
+        position = int(position)
+    except ValueError:
+        return None
+    return position if cursor_type == meal_type and position >= 0 else None
+
+# Similar meals endpoint
+@app.route('/api/similar-meals', methods=['GET'])
+def similar_meals():
+    """Find the meals of the same category closest to a meal in protein, carbs and fats"""
+    try:
+        meal_id = request.args.get('id', type=int)
+        if not is_meal_id(meal_id):
+            return jsonify({"error": "id must be an integer meal ID"}), 400
+        
+        k = request.args.get('k', DEFAULT_SIMILAR_MEALS, type=int)
+        if not 1 <= k <= MAX_SIMILAR_MEALS:
+            return jsonify({"error": f"k must be between 1 and {MAX_SIMILAR_MEALS}"}), 400
+        
+        match = request.args.get('match', 'all')
+        if match not in ('all', 'any'):
+            return jsonify({"error": "match must be 'all' or 'any'"}), 400
+        
+        try:
+            meal_type, _ = diet_generator.meal_store.locate(meal_id)
+        except KeyError as e:
+            return jsonify({"error": str(e.args[0])}), 404
+        meal = diet_generator.meal_store.meal(meal_id)
+        
+        index = diet_generator.meal_index[meal_type]
+        tags = [tag for tag in request.args.get('tags', '').split(',') if tag]
+        mask = index.any_of(tags) if tags and match == 'any' else index.all_of(tags)
+        
+        # Ask for one extra so the meal itself can be dropped from its own neighbours
+        neighbours = index.macro_nearest([meal[field] for field in MACRO_AXES], mask, k + 1)
+        similar = [
+            {**neighbour, "macroDistance": round(distance, 1)}
+            for distance, neighbour in neighbours if neighbour["id"] != meal_id
+        ][:k]
+        
+        return jsonify({
+            "success": True,
+            "meal": meal,
+            "mealType": meal_type,
+            "count": len(similar),
+            "meals": similar
+        }), 200
+        
+    except Exception as e:
+        logger.error(f"Error finding similar meals: {str(e)}")
+        return jsonify({
+            "error": "Failed to find similar meals",
+            "details": str(e)
+        }), 500
+
 # Nutritional calculation endpoint
 @app.route('/api/calculate-nutrition', methods=['POST'])
 def calculate_nutrition():
-    """Calculate nutrition for multiple meals"""
+    """Calculate nutrition for uploaded meals, catalog meal IDs, or batches of meal-sets"""
     try:
-        meals = request.json.get('meals', [])
+        payload = request.json
+        
+        # Catalog IDs (with optional portions) are resolved server-side, many meal-sets at a time
+        if 'mealSets' in payload or 'mealIds' in payload:
+            batch = 'mealSets' in payload
+            meal_sets = payload['mealSets'] if batch else [payload]
+            if not isinstance(meal_sets, list) or not meal_sets:
+                return jsonify({"error": "mealSets must be a non-empty list"}), 400
+            if len(meal_sets) > MAX_NUTRITION_MEAL_SETS:
+                return jsonify({"error": f"At most {MAX_NUTRITION_MEAL_SETS} meal-sets per request"}), 400
+            
+            ids, portions, set_index = [], [], []
+            for number, meal_set in enumerate(meal_sets):
+                set_ids = meal_set.get('mealIds') if isinstance(meal_set, dict) else None
+                if not isinstance(set_ids, list) or not set_ids or not all(is_meal_id(m) for m in set_ids):
+                    return jsonify({"error": f"Meal-set {number}: mealIds must be a non-empty list of integer meal IDs"}), 400
+                set_portions = meal_set.get('portions', [1] * len(set_ids))
+                if (
+                    not isinstance(set_portions, list) or len(set_portions) != len(set_ids)
+                    or not all(isinstance(p, (int, float)) and p >= 0 for p in set_portions)
+                ):
+                    return jsonify({"error": f"Meal-set {number}: portions must be one non-negative number per meal ID"}), 400
+                ids += set_ids
+                portions += set_portions
+                set_index += [number] * len(set_ids)
+            
+            try:
+                totals = diet_generator.meal_store.set_totals(ids, portions, set_index, len(meal_sets))
+            except KeyError as e:
+                return jsonify({"error": str(e.args[0])}), 400
+            
+            percentages = macro_percentages(totals)
+            results = [
+                {
+                    "mealCount": len(meal_set['mealIds']),
+                    "totals": {field: json_number(value) for field, value in zip(NUTRIENTS, row)},
+                    "macroPercentages": percentages[number]
+                }
+                for number, (meal_set, row) in enumerate(zip(meal_sets, totals.tolist()))
+            ]
+            if batch:
+                return jsonify({"success": True, "count": len(results), "results": results}), 200
+            return jsonify({"success": True, **results[0]}), 200
+        
+        meals = payload.get('meals', [])
         
         if not meals:
             return jsonify({"error": "No meals provided"}), 400
         
-        total_calories = sum(m.get('calories', 0) for m in meals)
-        total_protein = sum(m.get('protein', 0) for m in meals)
-        total_carbs = sum(m.get('carbs', 0) for m in meals)
-        total_fats = sum(m.get('fats', 0) for m in meals)
+        totals = sum_nutrients(meals)
         
         return jsonify({
             "success": True,
             "mealCount": len(meals),
             "totals": {
-                "calories": total_calories,
-                "protein": total_protein,
-                "carbs": total_carbs,
-                "fats": total_fats
+                "calories": totals['calories'],
+                "protein": totals['protein'],
+                "carbs": totals['carbs'],
+                "fats": totals['fats']
             },
-            "macroPercentages": {
-                "protein": round((total_protein * 4 / total_calories * 100) if total_calories > 0 else 0, 1),
-                "carbs": round((total_carbs * 4 / total_calories * 100) if total_calories > 0 else 0, 1),
-                "fats": round((total_fats * 9 / total_calories * 100) if total_calories > 0 else 0, 1)
-            }
+            "macroPercentages": macro_percentages([totals[field] for field in NUTRIENTS])[0]
         }), 200
         
     except Exception as e:
@@ -247,37 +563,30 @@ def calculate_nutrition():
 # Shopping list endpoint
 @app.route('/api/shopping-list', methods=['POST'])
 def get_shopping_list():
-    """Generate shopping list from meal plan"""
+    """Generate shopping list from meal plan or a list of meal IDs"""
     try:
-        meal_plan = request.json
-        shopping_list = diet_generator._generate_shopping_list(meal_plan)
-        
-        # Group by category (mock categorization)
-        categories = {
-            "Proteins": ["chicken", "beef", "fish", "turkey", "eggs", "tofu", "tempeh"],
-            "Grains": ["rice", "oats", "bread", "pasta", "quinoa"],
-            "Vegetables": ["broccoli", "asparagus", "kale", "spinach", "bell pepper", "tomato"],
-            "Fruits": ["apple", "banana", "berries", "avocado"],
-            "Dairy": ["milk", "yogurt", "cheese"],
-            "Other": []
-        }
+        payload = request.json
         
-        categorized_list = {cat: [] for cat in categories}
+        # A compact list of catalog meal IDs avoids re-uploading the whole plan
+        if 'mealIds' in payload:
+            meal_ids = payload['mealIds']
+            if not isinstance(meal_ids, list) or not all(is_meal_id(m) for m in meal_ids):
+                return jsonify({"error": "mealIds must be a list of integer meal IDs"}), 400
+            try:
+                servings = diet_generator.count_meal_id_ingredients(meal_ids)
+            except KeyError as e:
+                return jsonify({"error": str(e.args[0])}), 400
+        else:
+            servings = diet_generator.count_plan_ingredients(payload)
         
-        for item in shopping_list:
-            found = False
-            for category, items in categories.items():
-                if any(cat_item in item.lower() for cat_item in items):
-                    categorized_list[category].append(item)
-                    found = True
-                    break
-            if not found:
-                categorized_list["Other"].append(item)
+        shopping_list = sorted(servings)
+        categorized_list = diet_generator.categorize_shopping_list(shopping_list)
         
         return jsonify({
             "success": True,
             "count": len(shopping_list),
             "items": shopping_list,
+            "servings": dict(sorted(servings.items())),
             "categorized": categorized_list
         }), 200
         
@@ -288,6 +597,43 @@ def get_shopping_list():
             "details": str(e)
         }), 500
 
+# Exercise alternatives endpoint
+@app.route('/api/exercise-alternatives', methods=['POST'])
+def get_exercise_alternatives():
+    """Look up the alternatives of many exercises by name in one request"""
+    try:
+        names = (request.json or {}).get('exercises')
+        if not isinstance(names, list) or not all(isinstance(name, str) for name in names):
+            return jsonify({"error": "exercises must be a list of exercise names"}), 400
+        if len(names) > MAX_ALTERNATIVE_EXERCISES:
+            return jsonify({
+                "error": f"At most {MAX_ALTERNATIVE_EXERCISES} exercises can be looked up per request"
+            }), 400
+        
+        # Names are matched ignoring case and answered under the spelling they were sent with
+        alternatives = {}
+        unknown = []
+        for name in dict.fromkeys(names):
+            exercise = workout_generator.find_exercise(name)
+            if exercise is None:
+                unknown.append(name)
+            else:
+                alternatives[name] = exercise.get('alternatives', [])
+        
+        return jsonify({
+            "success": True,
+            "count": len(alternatives),
+            "alternatives": alternatives,
+            "unknown": unknown
+        }), 200
+        
+    except Exception as e:
+        logger.error(f"Error looking up exercise alternatives: {str(e)}")
+        return jsonify({
+            "error": "Failed to look up exercise alternatives",
+            "details": str(e)
+        }), 500
+
 # Error handlers
 @app.errorhandler(404)
 def not_found(error):
@@ -304,7 +650,10 @@ if __name__ == '__main__':
     print("   POST /api/diet-plan - Generate 7-day diet plan")
     print("   POST /api/workout-plan - Generate 8-week workout plan")
     print("   POST /api/recommendations - Get AI recommendations")
-    print("   GET /api/meal-search - Search meals")
+    print("   GET /api/cache-stats - Plan cache statistics")
+    print("   GET /api/meal-search - Search meals (tags, macro ranges, pagination)")
+    print("   GET /api/similar-meals - Meals with the closest macros to a meal")
     print("   POST /api/calculate-nutrition - Calculate meal nutrition")
     print("   POST /api/shopping-list - Generate shopping list")
+    print("   POST /api/exercise-alternatives - Alternatives for many exercises at once")
     app.run(debug=True, port=5000)
@@ -0,0 +1,205 @@
+"""
+Offline Bulk Plan Generation
+Generates diet and workout plans for a whole file of member profiles across a process pool
+
+Usage: python bulk_generate.py profiles.ndjson plans.ndjson [--workers N] [--chunksize N] [--days N]
+
+Each input line is one profile JSON object (the same body /api/diet-plan and
+/api/workout-plan accept). Each output line holds the plans for the profile on the
+same input line, in input order. A throughput report is printed at the end.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+from catalog import build_stale_catalogs
+from diet_ai import DIET_REQUIRED_FIELDS, MAX_PLAN_DAYS, diet_generator, variety_error
+from workout_ai import WORKOUT_REQUIRED_FIELDS, workout_generator
+from energy import measurement_error, resolve_target_calories, target_calories
+from plan_cache import PlanCache, list_field_error
+
+# Members onboarded together mostly share profile shapes, so each worker reuses diet plans
+_diet_plan_cache = PlanCache(maxsize=1024, ttl=3600)
+
+# Workout plans only vary by template, goal and conditions
+_workout_plan_cache = PlanCache(maxsize=256, ttl=3600)
+
+# Input lines handed to the pool per dispatch window, per worker and chunk
+WINDOW_CHUNKS_PER_WORKER = 4
+
+
+def generate_plans(jobs: List[Tuple[int, str, int]]) -> List[Tuple[str, bool]]:
+    """Generate the diet and workout plans for a chunk of input lines
+
+    Returns one (output line, whether any part of the profile failed) per input line.
+    """
+    profiles: List[Any] = []
+    for _, line, _ in jobs:
+        try:
+            profiles.append(json.loads(line))
+        except ValueError as e:
+            profiles.append(e)
+    
+    # Calorie targets for the whole chunk come from one vectorized energy pass; profiles
+    # with unusable measurements are left out of it and only fail their own diet plan
+    calories: List[Any] = [None] * len(profiles)
+    valid = []
+    for position, profile in enumerate(profiles):
+        if isinstance(profile, dict):
+            error = measurement_error(profile)
+            if error:
+                calories[position] = ValueError(error)
+            else:
+                valid.append(position)
+    try:
+        targets = target_calories([profiles[position] for position in valid])
+    except (TypeError, ValueError):
+        # A malformed profile fails the whole pass, so resolve each one alone and let only it fail
+        targets = [_resolve_calories(profiles[position]) for position in valid]
+    for position, target in zip(valid, targets):
+        calories[position] = target
+    
+    return [
+        generate_profile_plans(line_number, profile, target, days)
+        for (line_number, _, days), profile, target in zip(jobs, profiles, calories)
+    ]
+
+
+def _resolve_calories(user_profile: Dict[str, Any]) -> Any:
+    """Get one profile's calorie target, or the error its fields raise"""
+    try:
+        return resolve_target_calories(user_profile)
+    except (TypeError, ValueError) as e:
+        return e
+
+
+def generate_profile_plans(line_number: int, user_profile: Any, calories: Any, days: int) -> Tuple[str, bool]:
+    """Generate the diet and workout plans for one parsed input line"""
+    result: Dict[str, Any] = {"line": line_number}
+    # Plans come back already encoded and are spliced into the line as-is
+    encoded: Dict[str, bytes] = {}
+    try:
+        if isinstance(user_profile, Exception):
+            raise user_profile
+        if not isinstance(user_profile, dict):
+            raise ValueError("Each line must be a JSON object")
+        if "id" in user_profile:
+            result["id"] = user_profile["id"]
+
+        missing_diet = [field for field in DIET_REQUIRED_FIELDS if field not in user_profile]
+        invalid_diet = list_field_error(user_profile) or variety_error(user_profile)
+        if missing_diet:
+            result["dietError"] = f"Missing required fields: {', '.join(missing_diet)}"
+        elif invalid_diet:
+            result["dietError"] = invalid_diet
+        elif isinstance(calories, Exception):
+            result["dietError"] = f"Invalid profile fields: {calories}"
+        else:
+            diet_profile = {**user_profile, "targetCalories": calories}
+            cache_key = diet_generator.plan_cache_key(diet_profile, days=days)
+            plan_payload = _diet_plan_cache.get(cache_key)
+            if plan_payload is None:
+                plan_payload = diet_generator.generate_plan_payload(diet_profile, days=days)
+                _diet_plan_cache.put(cache_key, plan_payload)
+            encoded["diet"] = diet_generator.render_plan(plan_payload, diet_profile)
+
+        missing_workout = [field for field in WORKOUT_REQUIRED_FIELDS if field not in user_profile]
+        invalid_workout = list_field_error(user_profile, ("medicalConditions",))
+        if missing_workout:
+            result["workoutError"] = f"Missing required fields: {', '.join(missing_workout)}"
+        elif invalid_workout:
+            result["workoutError"] = invalid_workout
+        else:
+            cache_key = workout_generator.plan_cache_key(user_profile)
+            plan_payload = _workout_plan_cache.get(cache_key)
+            if plan_payload is None:
+                plan_payload = workout_generator.generate_plan_payload(user_profile)
+                _workout_plan_cache.put(cache_key, plan_payload)
+            encoded["workout"] = workout_generator.render_plan(plan_payload, user_profile)
+    except Exception as e:
+        result["error"] = str(e)
+
+    # Serialise in the worker so the parent only moves strings
+    failed = any(key in result for key in ("error", "dietError", "workoutError"))
+    line = json.dumps(result)
+    if encoded:
+        line = line[:-1] + "".join(f', "{key}": ' + plan.decode("utf-8") for key, plan in encoded.items()) + "}"
+    return line, failed
+
+
+def read_jobs(path: str, days: int) -> Iterator[Tuple[int, str, int]]:
+    """Yield (line number, line, days) for every non-blank input line"""
+    with open(path, encoding="utf-8") as handle:
+        for line_number, line in enumerate(handle, start=1):
+            if line.strip():
+                yield line_number, line, days
+
+
+def run(input_path: str, output_path: str, workers: int, chunksize: int, days: int) -> Dict[str, Any]:
+    """Generate plans for every profile in the input file and write them to the output file"""
+    jobs = read_jobs(input_path, days)
+    window = workers * chunksize * WINDOW_CHUNKS_PER_WORKER
+    count = 0
+    failures = 0
+    started = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=workers) as executor, open(output_path, "w", encoding="utf-8") as output:
+        # Dispatch a bounded window at a time so huge inputs never sit in memory at once
+        while True:
+            batch: List[Tuple[int, str, int]] = list(islice(jobs, window))
+            if not batch:
+                break
+            chunks = [batch[start:start + chunksize] for start in range(0, len(batch), chunksize)]
+            for results in executor.map(generate_plans, chunks):
+                for line, failed in results:
+                    output.write(line + "\n")
+                    count += 1
+                    failures += failed
+
+    elapsed = time.perf_counter() - started
+    per_second = count / elapsed if elapsed > 0 else 0.0
+    return {
+        "profiles": count,
+        "failures": failures,
+        "seconds": round(elapsed, 3),
+        "workers": workers,
+        "profilesPerSecond": round(per_second, 1),
+        "profilesPerSecondPerCore": round(per_second / workers, 1)
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Run the bulk generator from the command line"""
+    parser = argparse.ArgumentParser(description="Generate diet and workout plans for an NDJSON file of profiles")
+    parser.add_argument("input", help="NDJSON file with one profile per line")
+    parser.add_argument("output", help="NDJSON file to write one plan record per profile to")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes (default: all cores)")
+    parser.add_argument("--chunksize", type=int, default=64, help="profiles sent to a worker per dispatch")
+    parser.add_argument("--days", type=int, default=7, help=f"diet plan length in days, at most {MAX_PLAN_DAYS}")
+    args = parser.parse_args(argv)
+
+    if args.workers < 1 or args.chunksize < 1:
+        parser.error("--workers and --chunksize must be positive")
+    if not 1 <= args.days <= MAX_PLAN_DAYS:
+        parser.error(f"--days must be between 1 and {MAX_PLAN_DAYS}")
+
+    # Compile once here rather than in every worker process
+    build_stale_catalogs()
+    report = run(args.input, args.output, args.workers, args.chunksize, args.days)
+    print(
+        f"Generated plans for {report['profiles']} profiles ({report['failures']} with errors) "
+        f"in {report['seconds']}s on {report['workers']} workers: "
+        f"{report['profilesPerSecond']} profiles/sec, {report['profilesPerSecondPerCore']} profiles/sec per core",
+        file=sys.stderr
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
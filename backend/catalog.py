@@ -0,0 +1,347 @@
+"""
+Compiled Catalog Files
+Compiles the JSON meal and exercise catalogs into a compact memory-mapped binary with prebuilt indexes
+
+The compiled file holds, per category, fixed-width numeric columns, a packed bitmask
+per tag and one compact JSON record per entry. Opening it maps the file read-only,
+so arrays are zero-copy views shared through the page cache by every worker process,
+and records are only decoded when an entry is actually touched. Decoded entries are
+compact immutable CatalogRecords rather than dicts.
+
+Usage: python catalog.py [source.json ...]   (rebuilds the compiled files; part of every deploy)
+"""
+
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from collections.abc import Mapping, Sequence
+from typing import Dict, List, Any, Callable, Iterator, Optional, Tuple
+import numpy as np
+
+import meal_swaps
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+# Identifies the file format; bump the number whenever the layout changes so old files count as stale
+MAGIC = b"VFCAT001"
+ALIGNMENT = 8
+
+# Compile settings for each catalog source, keyed by file name
+CATALOG_SPECS = {
+    "meals.json": {
+        "columns": ("id", "calories", "protein", "carbs", "fats"),
+        "sort_field": "calories",
+        "tag_field": "suitableFor",
+        "expand": meal_swaps.expand_meal_catalog
+    },
+    "exercises.json": {
+        "columns": ("id",),
+        "tag_field": "contraindications"
+    },
+}
+
+# Field-name-to-slot maps shared by every record with the same fields, keyed by field names
+_FIELD_INDEXES: Dict[Tuple[str, ...], Dict[str, int]] = {}
+
+
+def _aligned(offset: int) -> int:
+    """Round an offset up to the array alignment"""
+    return offset + (-offset % ALIGNMENT)
+
+
+class CatalogRecord(Mapping):
+    """An immutable catalog entry, read like a dict
+
+    Records with the same fields share one field index, lists become tuples and strings
+    are interned, so each decoded entry costs a tuple of values instead of a dict with
+    its own copies of every key and tag.
+    """
+
+    __slots__ = ("_index", "_values")
+
+    def __init__(self, index: Dict[str, int], values: Tuple[Any, ...]):
+        self._index = index
+        self._values = values
+
+    def __getitem__(self, field: str) -> Any:
+        return self._values[self._index[field]]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._index)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def __repr__(self) -> str:
+        return f"CatalogRecord({dict(self)!r})"
+
+
+def _freeze(value: Any) -> Any:
+    """Turn a decoded JSON value into its immutable, interned form"""
+    if isinstance(value, str):
+        return sys.intern(value)
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def thaw(value: Any) -> Any:
+    """Turn a record, or any value read from one, back into plain JSON types (dicts and lists)"""
+    if isinstance(value, CatalogRecord):
+        return {field: thaw(item) for field, item in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(item) for item in value]
+    return value
+
+
+def _record_from_pairs(pairs: List[Tuple[str, Any]]) -> CatalogRecord:
+    """Build a record from a decoded JSON object's (field, value) pairs"""
+    fields = tuple(field for field, _ in pairs)
+    index = _FIELD_INDEXES.get(fields)
+    if index is None:
+        index = _FIELD_INDEXES.setdefault(fields, {sys.intern(field): i for i, field in enumerate(fields)})
+    return CatalogRecord(index, tuple(_freeze(value) for _, value in pairs))
+
+
+def decode_record(record: bytes) -> CatalogRecord:
+    """Decode a compact JSON record into a CatalogRecord"""
+    return json.loads(record, object_pairs_hook=_record_from_pairs)
+
+
+def pack_mask(flags: np.ndarray) -> bytes:
+    """Pack a boolean array into little-endian bitmask bytes (bit i is entry i)"""
+    return np.packbits(np.asarray(flags, dtype=bool), bitorder="little").tobytes()
+
+
+def unpack_mask(packed: Any) -> int:
+    """Turn packed bitmask bytes back into a Python int bitmask"""
+    return int.from_bytes(bytes(packed), "little")
+
+
+class CatalogCategory(Sequence):
+    """Read-only view of one catalog category; entries decode lazily on first access"""
+
+    def __init__(self, name: str, buffer: Any, data_start: int, layout: Dict[str, Any]):
+        self.name = name
+        self._buffer = buffer
+        self._data_start = data_start
+        self._layout = layout
+        self._count = layout["count"]
+        self._offsets = self._array(layout["recordOffsets"])
+        self._records = self._array(layout["records"])
+        self._decoded: Dict[int, CatalogRecord] = {}
+
+    def _array(self, spec: List[Any]) -> np.ndarray:
+        offset, dtype, count = spec
+        return np.frombuffer(self._buffer, dtype=np.dtype(dtype), count=count, offset=self._data_start + offset)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, position: Any) -> Any:
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(self._count))]
+        if position < 0:
+            position += self._count
+        if not 0 <= position < self._count:
+            raise IndexError(f"{self.name} has no entry {position}")
+
+        entry = self._decoded.get(position)
+        if entry is None:
+            entry = decode_record(self.record(position))
+            self._decoded[position] = entry
+        return entry
+
+    def record(self, position: int) -> bytes:
+        """Get an entry's compact JSON record without decoding it"""
+        start, end = self._offsets[position], self._offsets[position + 1]
+        return self._records[start:end].tobytes()
+
+    def __iter__(self) -> Iterator[CatalogRecord]:
+        for position in range(self._count):
+            yield self[position]
+
+    @property
+    def columns(self) -> List[str]:
+        """Names of the numeric columns stored for this category"""
+        return list(self._layout["columns"])
+
+    def column(self, field: str) -> np.ndarray:
+        """Get a zero-copy view of a numeric column"""
+        return self._array(self._layout["columns"][field])
+
+    def tag_masks(self) -> Dict[str, int]:
+        """Get the prebuilt bitmask of every tag over this category's entries"""
+        return {
+            tag: unpack_mask(self._array(spec).tobytes())
+            for tag, spec in self._layout["tags"].items()
+        }
+
+
+class Catalog:
+    """A compiled catalog file opened through a read-only memory map"""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as handle:
+            self._map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a compiled catalog")
+        (header_size,) = struct.unpack_from("<Q", self._map, len(MAGIC))
+        header_start = len(MAGIC) + 8
+        header = json.loads(self._map[header_start:header_start + header_size])
+        data_start = _aligned(header_start + header_size)
+
+        self.source = header["source"]
+        self.categories = {
+            name: CatalogCategory(name, self._map, data_start, layout)
+            for name, layout in header["categories"].items()
+        }
+
+
+def compile_catalog(
+    source_path: str,
+    compiled_path: str,
+    columns: Sequence = (),
+    sort_field: Optional[str] = None,
+    tag_field: Optional[str] = None,
+    expand: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None
+) -> None:
+    """Compile a JSON catalog ({category: [entry, ...]}) into the binary format
+
+    Entries are stably sorted by `sort_field` within each category, so positions in
+    the compiled file double as ranks of that field. The file is written to a temporary
+    name and renamed into place, so concurrent readers never see a partial file.
+    `expand`, if given, derives extra entries (e.g. dietary swap variants) from the
+    parsed source before it is compiled.
+    """
+    with open(source_path, encoding="utf-8") as handle:
+        source = json.load(handle)
+    if expand is not None:
+        source = expand(source)
+
+    blobs: List[bytes] = []
+    size = 0
+
+    def place(data: bytes, dtype: str, count: int) -> List[Any]:
+        nonlocal size
+        padding = -size % ALIGNMENT
+        blobs.append(b"\0" * padding + data)
+        size += padding + len(data)
+        return [size - len(data), dtype, count]
+
+    layouts = {}
+    for name, entries in source.items():
+        if sort_field is not None:
+            entries = sorted(entries, key=lambda entry: entry[sort_field])
+
+        records = [json.dumps(entry, separators=(",", ":"), ensure_ascii=False).encode("utf-8") for entry in entries]
+        offsets = np.zeros(len(records) + 1, dtype="<i8")
+        offsets[1:] = np.cumsum([len(record) for record in records])
+
+        layout = {"count": len(entries), "columns": {}, "tags": {}}
+        layout["recordOffsets"] = place(offsets.tobytes(), "<i8", len(offsets))
+        joined = b"".join(records)
+        layout["records"] = place(joined, "u1", len(joined))
+
+        for field in columns:
+            values = np.asarray([entry[field] for entry in entries])
+            values = values.astype("<i8" if values.dtype.kind in "iub" else "<f8")
+            layout["columns"][field] = place(values.tobytes(), values.dtype.str, len(values))
+
+        if tag_field is not None:
+            tags = sorted({tag for entry in entries for tag in entry.get(tag_field, [])})
+            for tag in tags:
+                packed = pack_mask([tag in entry.get(tag_field, []) for entry in entries])
+                layout["tags"][tag] = place(packed, "u1", len(packed))
+
+        layouts[name] = layout
+
+    header = json.dumps({"source": os.path.basename(source_path), "categories": layouts}).encode("utf-8")
+    header_end = len(MAGIC) + 8 + len(header)
+
+    directory = os.path.dirname(os.path.abspath(compiled_path))
+    descriptor, temporary = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(descriptor, "wb") as handle:
+            handle.write(MAGIC)
+            handle.write(struct.pack("<Q", len(header)))
+            handle.write(header)
+            handle.write(b"\0" * (_aligned(header_end) - header_end))
+            for blob in blobs:
+                handle.write(blob)
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, compiled_path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+def compiled_path_for(source_path: str) -> str:
+    """Get where the compiled form of a JSON catalog lives"""
+    return os.path.splitext(source_path)[0] + ".bin"
+
+
+def build_catalog(source_path: str) -> str:
+    """Compile a JSON catalog using the settings registered for its file name"""
+    compiled_path = compiled_path_for(source_path)
+    compile_catalog(source_path, compiled_path, **CATALOG_SPECS.get(os.path.basename(source_path), {}))
+    return compiled_path
+
+
+def _build_inputs(source_path: str) -> List[str]:
+    """Get the files a compiled catalog depends on: its source, the compiler and any expansion code"""
+    expand = CATALOG_SPECS.get(os.path.basename(source_path), {}).get("expand")
+    inputs = [source_path, os.path.abspath(__file__)]
+    if expand is not None:
+        inputs.append(sys.modules[expand.__module__].__file__)
+    return inputs
+
+
+class StaleCatalogError(RuntimeError):
+    """Raised when a compiled catalog is missing, in an old format, or older than what it is built from"""
+
+
+def catalog_is_stale(source_path: str) -> bool:
+    """Check whether a JSON catalog's compiled file needs rebuilding"""
+    compiled_path = compiled_path_for(source_path)
+    if not os.path.exists(compiled_path):
+        return True
+    with open(compiled_path, "rb") as handle:
+        if handle.read(len(MAGIC)) != MAGIC:
+            return True
+    compiled_at = os.path.getmtime(compiled_path)
+    return any(compiled_at < os.path.getmtime(path) for path in _build_inputs(source_path))
+
+
+def build_stale_catalogs(sources: Optional[List[str]] = None) -> List[str]:
+    """Compile every catalog whose compiled file is missing or stale, returning the files built
+
+    Meant for single-process entry points (the dev server, bulk generation) before
+    they start any workers; servers with several workers rely on the deploy step.
+    """
+    sources = sources or [os.path.join(DATA_DIR, name) for name in CATALOG_SPECS]
+    return [build_catalog(source_path) for source_path in sources if catalog_is_stale(source_path)]
+
+
+def load_catalog(source_path: str) -> Catalog:
+    """Open the compiled form of a JSON catalog
+
+    Compiling a large catalog takes tens of seconds, so it happens when deploying
+    (`python catalog.py`), never inside a worker: a missing or stale compiled file
+    raises StaleCatalogError instead.
+    """
+    if catalog_is_stale(source_path):
+        raise StaleCatalogError(
+            f"{compiled_path_for(source_path)} is missing or out of date; run `python catalog.py` to rebuild it"
+        )
+    return Catalog(compiled_path_for(source_path))
+
+
+if __name__ == "__main__":
+    sources = sys.argv[1:] or [os.path.join(DATA_DIR, name) for name in CATALOG_SPECS]
+    for source_path in sources:
+        print(f"Compiled {source_path} -> {build_catalog(source_path)}")
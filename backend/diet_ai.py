@@ -4,273 +4,429 @@ Generates meal plans based on user profile, medical conditions, and dietary pref
 """
 
 import json
-from typing import Dict, List, Any
+import os
+import re
+from collections import Counter
+from functools import cached_property, lru_cache
+from typing import Dict, List, Any, Iterator, Optional, Tuple
 from datetime import datetime, timedelta
+import numpy as np
+from catalog import DATA_DIR, CatalogCategory, load_catalog, thaw
+from energy import daily_targets, resolve_target_calories
+from macro_tree import MACRO_AXES
+from meal_index import MealIndex
+from meal_optimizer import NUTRIENTS, optimize_day
+from meal_scheduler import VarietyScheduler
+from meal_store import MealStore
+from meal_swaps import DIETARY_SWAPS, RESTRICTION_SWAP_PROFILES, SWAP_PROFILES, VARIANT_TAG, profile_tag
+from payloads import PlanPayload, encode_json, splice_object
+
+MEAL_CATALOG_PATH = os.path.join(DATA_DIR, "meals.json")
+
+# Profile fields a diet plan request must include
+DIET_REQUIRED_FIELDS = ['goal', 'weight', 'height', 'age']
+
+# Dietary restrictions that only admit meals carrying a specific suitableFor tag
+RESTRICTION_TAGS = {
+    "Vegan": "vegan_friendly",
+    "Keto": "keto_friendly",
+    "Dairy-Free": "dairy_free",
+    "Gluten-Free": "gluten_free",
+}
+
+# Daily meal slots: (slot name, meal category, share of daily calories)
+MEAL_SLOTS = [
+    ("breakfast", "breakfast", 0.25),
+    ("lunch", "lunch", 0.35),
+    ("snack", "snacks", 0.10),
+    ("dinner", "dinner", 0.30),
+]
+
+# Key order of the per-day macro totals
+MACRO_FIELDS = ("protein", "carbs", "fats", "calories")
+
+# Closest-calorie meals considered per slot by the daily optimizer. This cap is what
+# keeps the exact day search fast; it does not scale to whole categories of hundreds
+CANDIDATES_PER_SLOT = 20
+
+# Extra meals per slot closest to the slot's share of the macro targets
+MACRO_CANDIDATES_PER_SLOT = 4
+
+# Days a meal stays out of its slot once served; 0 serves the best day every day
+DEFAULT_VARIETY_WINDOW = 3
+
+# Seed of the variety scheduler when the profile gives none, so plans are reproducible
+DEFAULT_VARIETY_SEED = 0
+
+# Longest no-repeat window a diet plan may ask for, in days
+MAX_VARIETY_WINDOW = 28
+
+# Longest diet plan that can be requested, in days
+MAX_PLAN_DAYS = 366
+
+# Shopping list sections, in priority order, with the keywords that place an ingredient in them
+INGREDIENT_CATEGORIES = {
+    "Proteins": ["chicken", "beef", "fish", "turkey", "eggs", "tofu", "tempeh"],
+    "Grains": ["rice", "oats", "bread", "pasta", "quinoa"],
+    "Vegetables": ["broccoli", "asparagus", "kale", "spinach", "bell pepper", "tomato"],
+    "Fruits": ["apple", "banana", "berries", "avocado"],
+    "Dairy": ["milk", "yogurt", "cheese"],
+    "Other": []
+}
+
+# Every keyword in one alternation, highest-priority section first. The lookahead matches
+# at every position, so overlapping keywords are all seen in a single scan.
+_INGREDIENT_SECTIONS = list(INGREDIENT_CATEGORIES)
+_INGREDIENT_RANKS = {
+    keyword: rank
+    for rank, keywords in enumerate(INGREDIENT_CATEGORIES.values())
+    for keyword in keywords
+}
+_INGREDIENT_PATTERN = re.compile(
+    "(?=(" + "|".join(re.escape(keyword) for keyword in _INGREDIENT_RANKS) + "))"
+)
+
+
+# Opening of each slot's meal objects; a catalog record minus its "{" completes one
+_SLOT_FRAGMENTS = [b'{"type":' + encode_json(slot) + b"," for slot, _, _ in MEAL_SLOTS]
+
+# Personalized tips by goal; unknown goals get the maintenance tips
+GOAL_TIPS = {
+    "bulking": [
+        "Eat 300-500 calories in surplus daily",
+        "Prioritize protein (1.6-2.2g per kg body weight)",
+        "Include calorie-dense foods like nuts, seeds, and oils",
+        "Don't neglect vegetables for micronutrients",
+        "Eat every 3-4 hours to maintain caloric surplus"
+    ],
+    "cutting": [
+        "Create a 300-500 calorie deficit daily",
+        "Prioritize high-protein foods for satiety",
+        "Load up on vegetables (low calorie, high volume)",
+        "Stay hydrated to reduce false hunger signals",
+        "Schedule cheat meals 1x per week for adherence"
+    ],
+    "maintenance": [
+        "Balance all three macronutrients",
+        "Eat intuitively when hungry, stop when satisfied",
+        "Include variety to ensure micronutrient coverage",
+        "Practice mindful eating",
+        "Adjust calories if body composition changes"
+    ],
+}
+
+# Daily water per kg of body weight, in ml, scaled by activity level
+HYDRATION_ML_PER_KG = 35
+HYDRATION_ACTIVITY_MULTIPLIERS = {
+    "sedentary": 1.0,
+    "light": 1.1,
+    "moderate": 1.2,
+    "active": 1.3,
+    "very_active": 1.4
+}
+DEFAULT_HYDRATION_MULTIPLIER = 1.2
+
+HYDRATION_SCHEDULE = [
+    "💧 Morning: 500ml with breakfast",
+    "💧 Mid-morning: 250ml with snack",
+    "💧 Lunch: 500ml",
+    "💧 Afternoon: 250ml with snack",
+    "💧 Dinner: 500ml",
+    "💧 Evening: 250ml"
+]
+
+HYDRATION_TIPS = [
+    "Drink water before meals to aid digestion",
+    "Add electrolytes on workout days",
+    "Monitor urine color (should be light yellow)"
+]
+
+# Supplements recommended to everyone, and the extras for vegans
+UNIVERSAL_SUPPLEMENTS = [
+    {
+        "supplement": "Vitamin D",
+        "dosage": "1000-2000 IU",
+        "reason": "Essential for bone health and immunity"
+    },
+    {
+        "supplement": "Omega-3 Fish Oil",
+        "dosage": "1-2g EPA+DHA",
+        "reason": "Anti-inflammatory, heart health"
+    },
+]
+VEGAN_SUPPLEMENTS = [
+    {
+        "supplement": "Vitamin B12",
+        "dosage": "1000-2000 mcg weekly",
+        "reason": "Not naturally found in plant-based foods"
+    },
+    {
+        "supplement": "Iron",
+        "dosage": "18mg",
+        "reason": "Plant-based iron has lower bioavailability"
+    },
+]
+
+# Food timing around workouts
+TRAINING_FOOD_PAIRING = {
+    "preWorkout": [
+        "30-60 min before: Banana with almond butter",
+        "30-60 min before: Rice cakes with honey",
+        "Choose easily digestible carbs + small protein"
+    ],
+    "postWorkout": [
+        "Within 30 min: Protein shake with fruit",
+        "Within 2 hours: Full meal with protein + carbs",
+        "Example: Chicken with rice and vegetables"
+    ],
+    "timing": "These windows optimize recovery and performance"
+}
+
+
+@lru_cache(maxsize=4096)
+def categorize_ingredient(ingredient: str) -> str:
+    """Get the shopping list section of an ingredient (first section with a matching keyword)"""
+    ranks = [_INGREDIENT_RANKS[match.group(1)] for match in _INGREDIENT_PATTERN.finditer(ingredient.lower())]
+    return _INGREDIENT_SECTIONS[min(ranks)] if ranks else "Other"
+
+
+def variety_error(user_profile: Dict[str, Any]) -> Optional[str]:
+    """Get why a profile's varietyWindow or varietySeed cannot be used, if either cannot"""
+    window = user_profile.get("varietyWindow", DEFAULT_VARIETY_WINDOW)
+    if isinstance(window, bool) or not isinstance(window, int) or not 0 <= window <= MAX_VARIETY_WINDOW:
+        return f"varietyWindow must be an integer between 0 and {MAX_VARIETY_WINDOW}"
+    seed = user_profile.get("varietySeed", DEFAULT_VARIETY_SEED)
+    if isinstance(seed, bool) or not isinstance(seed, int):
+        return "varietySeed must be an integer"
+    return None
 
 class DietAIGenerator:
     """Generates AI-powered personalized diet plans"""
     
-    def __init__(self):
-        self.meal_database = self._initialize_meal_database()
+    def __init__(self, catalog_path: str = MEAL_CATALOG_PATH):
+        self.catalog_path = catalog_path
         self.dietary_swaps = self._initialize_dietary_swaps()
     
-    def _initialize_meal_database(self) -> Dict[str, List[Dict[str, Any]]]:
-        """Initialize a comprehensive meal database"""
-        return {
-            "breakfast": [
-                {
-                    "name": "Oatmeal with Berries",
-                    "calories": 350,
-                    "protein": 12,
-                    "carbs": 55,
-                    "fats": 8,
-                    "ingredients": ["oats", "berries", "milk", "honey"],
-                    "suitableFor": ["vegan_friendly", "gluten_free_alt"],
-                    "time": "15 mins"
-                },
-                {
-                    "name": "Scrambled Eggs with Whole Wheat Toast",
-                    "calories": 380,
-                    "protein": 18,
-                    "carbs": 42,
-                    "fats": 14,
-                    "ingredients": ["eggs", "whole wheat bread", "butter", "spinach"],
-                    "suitableFor": ["keto_friendly"],
-                    "time": "10 mins"
-                },
-                {
-                    "name": "Greek Yogurt Parfait",
-                    "calories": 320,
-                    "protein": 20,
-                    "carbs": 45,
-                    "fats": 6,
-                    "ingredients": ["greek yogurt", "granola", "berries", "honey"],
-                    "suitableFor": ["high_protein"],
-                    "time": "5 mins"
-                },
-                {
-                    "name": "Smoothie Bowl",
-                    "calories": 340,
-                    "protein": 15,
-                    "carbs": 58,
-                    "fats": 5,
-                    "ingredients": ["banana", "berries", "protein powder", "almond milk"],
-                    "suitableFor": ["vegan_friendly", "high_protein"],
-                    "time": "8 mins"
-                },
-                {
-                    "name": "Avocado Toast",
-                    "calories": 380,
-                    "protein": 14,
-                    "carbs": 45,
-                    "fats": 16,
-                    "ingredients": ["whole grain bread", "avocado", "egg", "tomato"],
-                    "suitableFor": ["vegan_friendly"],
-                    "time": "10 mins"
-                },
-            ],
-            "lunch": [
-                {
-                    "name": "Grilled Chicken Salad",
-                    "calories": 450,
-                    "protein": 42,
-                    "carbs": 25,
-                    "fats": 18,
-                    "ingredients": ["chicken breast", "mixed greens", "olive oil", "vegetables"],
-                    "suitableFor": ["keto_friendly", "high_protein"],
-                    "time": "25 mins"
-                },
-                {
-                    "name": "Quinoa Buddha Bowl",
-                    "calories": 420,
-                    "protein": 16,
-                    "carbs": 52,
-                    "fats": 14,
-                    "ingredients": ["quinoa", "chickpeas", "vegetables", "tahini"],
-                    "suitableFor": ["vegan_friendly", "balanced"],
-                    "time": "25 mins"
-                },
-                {
-                    "name": "Salmon with Brown Rice",
-                    "calories": 480,
-                    "protein": 38,
-                    "carbs": 48,
-                    "fats": 14,
-                    "ingredients": ["salmon fillet", "brown rice", "broccoli", "olive oil"],
-                    "suitableFor": ["high_protein", "omega3"],
-                    "time": "30 mins"
-                },
-                {
-                    "name": "Vegan Lentil Curry",
-                    "calories": 410,
-                    "protein": 18,
-                    "carbs": 55,
-                    "fats": 10,
-                    "ingredients": ["red lentils", "coconut milk", "spices", "rice"],
-                    "suitableFor": ["vegan_friendly", "diabetes_friendly"],
-                    "time": "35 mins"
-                },
-                {
-                    "name": "Turkey Sandwich",
-                    "calories": 380,
-                    "protein": 28,
-                    "carbs": 38,
-                    "fats": 12,
-                    "ingredients": ["turkey", "whole wheat bread", "vegetables", "mustard"],
-                    "suitableFor": ["balanced", "gluten_free_alt"],
-                    "time": "10 mins"
-                },
-            ],
-            "dinner": [
-                {
-                    "name": "Grilled Fish with Vegetables",
-                    "calories": 420,
-                    "protein": 40,
-                    "carbs": 30,
-                    "fats": 14,
-                    "ingredients": ["white fish", "asparagus", "olive oil", "lemon"],
-                    "suitableFor": ["keto_friendly", "heart_healthy"],
-                    "time": "25 mins"
-                },
-                {
-                    "name": "Plant-Based Protein Bowl",
-                    "calories": 400,
-                    "protein": 22,
-                    "carbs": 48,
-                    "fats": 12,
-                    "ingredients": ["tempeh", "sweet potato", "kale", "tahini"],
-                    "suitableFor": ["vegan_friendly", "high_protein"],
-                    "time": "30 mins"
-                },
-                {
-                    "name": "Lean Beef Stir-Fry",
-                    "calories": 440,
-                    "protein": 36,
-                    "carbs": 42,
-                    "fats": 14,
-                    "ingredients": ["lean beef", "mixed vegetables", "brown rice", "soy sauce"],
-                    "suitableFor": ["balanced", "high_protein"],
-                    "time": "25 mins"
-                },
-                {
-                    "name": "Stuffed Bell Pepper",
-                    "calories": 380,
-                    "protein": 24,
-                    "carbs": 38,
-                    "fats": 12,
-                    "ingredients": ["bell pepper", "ground turkey", "quinoa", "cheese"],
-                    "suitableFor": ["balanced", "diabetes_friendly"],
-                    "time": "35 mins"
-                },
-                {
-                    "name": "Chickpea Pasta Primavera",
-                    "calories": 420,
-                    "protein": 16,
-                    "carbs": 55,
-                    "fats": 12,
-                    "ingredients": ["whole wheat pasta", "chickpeas", "seasonal vegetables", "olive oil"],
-                    "suitableFor": ["vegan_friendly", "high_fiber"],
-                    "time": "20 mins"
-                },
-            ],
-            "snacks": [
-                {
-                    "name": "Protein Bar",
-                    "calories": 200,
-                    "protein": 20,
-                    "carbs": 20,
-                    "fats": 6,
-                    "ingredients": ["whey protein", "oats", "nuts"],
-                    "suitableFor": ["high_protein", "convenient"],
-                    "time": "0 mins"
-                },
-                {
-                    "name": "Greek Yogurt with Nuts",
-                    "calories": 180,
-                    "protein": 15,
-                    "carbs": 12,
-                    "fats": 8,
-                    "ingredients": ["greek yogurt", "almonds", "honey"],
-                    "suitableFor": ["high_protein", "quick"],
-                    "time": "2 mins"
-                },
-                {
-                    "name": "Apple with Almond Butter",
-                    "calories": 200,
-                    "protein": 8,
-                    "carbs": 25,
-                    "fats": 9,
-                    "ingredients": ["apple", "almond butter"],
-                    "suitableFor": ["vegan_friendly", "portable"],
-                    "time": "2 mins"
-                },
-                {
-                    "name": "Mixed Nuts Trail Mix",
-                    "calories": 220,
-                    "protein": 7,
-                    "carbs": 20,
-                    "fats": 14,
-                    "ingredients": ["almonds", "cashews", "dried berries", "dark chocolate"],
-                    "suitableFor": ["keto_friendly", "portable"],
-                    "time": "0 mins"
-                },
-            ]
-        }
+    @cached_property
+    def meal_database(self) -> Dict[str, CatalogCategory]:
+        """Meal catalog by category, opened on first use so importing the module stays cheap"""
+        return self._initialize_meal_database()
+    
+    @cached_property
+    def meal_store(self) -> MealStore:
+        """Columnar nutrient store over the whole catalog"""
+        return MealStore(self.meal_database)
+    
+    @cached_property
+    def meal_index(self) -> Dict[str, MealIndex]:
+        """Tag and calorie index for every meal category"""
+        return self._build_meal_index()
+    
+    def _initialize_meal_database(self) -> Dict[str, CatalogCategory]:
+        """Open the compiled meal catalog"""
+        return load_catalog(self.catalog_path).categories
     
     def _initialize_dietary_swaps(self) -> Dict[str, str]:
         """Initialize dietary substitutions"""
-        return {
-            "milk": "almond milk",
-            "chicken": "tofu",
-            "bread": "gluten-free bread",
-            "pasta": "chickpea pasta",
-            "rice": "cauliflower rice",
-            "butter": "coconut oil",
-            "eggs": "flax eggs",
-            "cheese": "nutritional yeast",
-        }
+        return {keyword: swap["replacement"] for keyword, swap in DIETARY_SWAPS.items()}
+    
+    def _build_meal_index(self) -> Dict[str, MealIndex]:
+        """Build the tag bitmask index for every meal category"""
+        return {meal_type: MealIndex(meals) for meal_type, meals in self.meal_database.items()}
     
     def generate_meal_plan(self, user_profile: Dict[str, Any], days: int = 7) -> Dict[str, Any]:
         """Generate a personalized 7-day meal plan"""
         
+        meal_plan, plan_days, daily_macros = self._build_plan(user_profile, days)
+        
+        # Repeated days share one meal list
+        day_meals: Dict[tuple, List[Dict[str, Any]]] = {}
+        for day, (day_ids, macros) in enumerate(zip(plan_days, daily_macros)):
+            if day_ids not in day_meals:
+                day_meals[day_ids] = self._day_meals(day_ids)
+            meal_plan["days"][f"day_{day + 1}"] = {
+                "date": self._day_date(day),
+                "meals": day_meals[day_ids],
+                "totalCalories": macros["calories"],
+                "macros": macros
+            }
+        
+        return meal_plan
+    
+    def generate_plan_payload(self, user_profile: Dict[str, Any], days: int = 7) -> PlanPayload:
+        """Generate a meal plan pre-encoded for serving; render it with render_plan
+        
+        Meals are spliced in from the compiled catalog's JSON records, so no meal is
+        copied or re-serialised.
+        """
+        meal_plan, plan_days, daily_macros = self._build_plan(user_profile, days)
+        
+        encoded_days: Dict[tuple, bytes] = {}
+        for day_ids, macros in zip(plan_days, daily_macros):
+            if day_ids not in encoded_days:
+                encoded_days[day_ids] = splice_object({
+                    "meals": self._encoded_meals(day_ids),
+                    "totalCalories": encode_json(macros["calories"]),
+                    "macros": encode_json(macros)
+                })
+        
+        return PlanPayload(
+            {field: encode_json(value) for field, value in meal_plan.items() if field not in PlanPayload.REQUEST_FIELDS},
+            [encoded_days[day_ids] for day_ids in plan_days]
+        )
+    
+    def render_plan(self, payload: PlanPayload, user_profile: Dict[str, Any]) -> bytes:
+        """Encode a plan payload with its timestamp, day dates and echoed restrictions set for this request"""
+        return payload.render(
+            datetime.now().isoformat(),
+            user_profile.get("dietaryRestrictions", []),
+            [self._day_date(day) for day in range(len(payload))]
+        )
+    
+    def _build_plan(
+        self,
+        user_profile: Dict[str, Any],
+        days: int
+    ) -> Tuple[Dict[str, Any], List[tuple], List[Dict[str, Any]]]:
+        """Generate a plan's fields (with "days" left empty), every day's meal IDs and every day's macros"""
+        
         goal = user_profile.get("goal", "maintenance")
         medical_conditions = user_profile.get("medicalConditions", [])
+        
+        meal_plan = {**self._plan_header(user_profile, days), "days": {}}
+        plan_days = []
+        servings = Counter()
+        day_servings: Dict[tuple, Counter] = {}
+        
+        # Tally ingredient servings as days are generated instead of re-walking the plan
+        for _, day_ids in self._iter_plan_days(user_profile, days):
+            if day_ids not in day_servings:
+                day_servings[day_ids] = self._count_meal_ingredients(
+                    [self.meal_store.meal(meal_id) for meal_id in day_ids]
+                )
+            servings.update(day_servings[day_ids])
+            plan_days.append(day_ids)
+        
+        # Daily and whole-plan macros in one pass over the (days, meals) ID matrix
+        daily_macros, meal_plan["totalMacros"] = self._calculate_plan_macros(plan_days)
+        
+        # Add shopping list
+        meal_plan["shoppingList"] = sorted(servings)
+        meal_plan["ingredientServings"] = dict(sorted(servings.items()))
+        
+        # Add meal prep tips
+        meal_plan["mealPrepTips"] = self._get_meal_prep_tips(goal, medical_conditions)
+        
+        return meal_plan, plan_days, daily_macros
+    
+    def iter_meal_plan(self, user_profile: Dict[str, Any], days: int = 7) -> Iterator[Dict[str, Any]]:
+        """Generate a meal plan as a stream of records for long horizons
+
+        Yields a "plan" header, one "day" record per day, then a "shoppingList" and a
+        "summary" record. Only the running totals and the previous day's macros and
+        ingredient tallies are kept, so memory stays flat however many days are streamed.
+        """
+        goal = user_profile.get("goal", "maintenance")
+        medical_conditions = user_profile.get("medicalConditions", [])
+        
+        yield {"record": "plan", **self._plan_header(user_profile, days)}
+        
+        servings = Counter()
+        total_macros = {field: 0 for field in MACRO_FIELDS}
+        
+        # Repeated days come back to back (without a variety window every day is the same),
+        # so only the previous day is remembered
+        previous_ids = None
+        for day, day_ids in self._iter_plan_days(user_profile, days):
+            day_meals = self._day_meals(day_ids)
+            if day_ids != previous_ids:
+                previous_ids = day_ids
+                macros = self._calculate_plan_macros([day_ids])[0][0]
+                day_servings = self._count_meal_ingredients(day_meals)
+            servings.update(day_servings)
+            for field in MACRO_FIELDS:
+                total_macros[field] += macros[field]
+            
+            yield {
+                "record": "day",
+                "day": f"day_{day + 1}",
+                "date": self._day_date(day),
+                "meals": day_meals,
+                "totalCalories": macros["calories"],
+                "macros": macros
+            }
+        
+        yield {"record": "shoppingList", "items": sorted(servings), "servings": dict(sorted(servings.items()))}
+        yield {
+            "record": "summary",
+            "days": days,
+            "totalMacros": total_macros,
+            "mealPrepTips": self._get_meal_prep_tips(goal, medical_conditions)
+        }
+    
+    def _plan_header(self, user_profile: Dict[str, Any], days: int) -> Dict[str, Any]:
+        """Build the plan-level fields shared by the full and streamed plans"""
+        medical_conditions = user_profile.get("medicalConditions", [])
         dietary_restrictions = user_profile.get("dietaryRestrictions", [])
-        target_calories = user_profile.get("targetCalories", 2000)
+        target_calories = resolve_target_calories(user_profile)
         
-        meal_plan = {
+        return {
             "generatedAt": datetime.now().isoformat(),
             "duration": f"{days} days",
             "targetCalories": target_calories,
-            "goal": goal,
+            "goal": user_profile.get("goal", "maintenance"),
             "medicalConsiderations": self._get_medical_notes(medical_conditions),
             "dietaryNotes": dietary_restrictions,
-            "days": {}
-        }
-        
-        # Generate meals for each day
-        for day in range(days):
-            day_date = (datetime.now() + timedelta(days=day)).strftime("%A, %B %d")
-            day_meals = self._generate_daily_meals(
-                target_calories,
-                goal,
-                medical_conditions,
-                dietary_restrictions
-            )
-            meal_plan["days"][f"day_{day + 1}"] = {
-                "date": day_date,
-                "meals": day_meals,
-                "totalCalories": sum(m.get("calories", 0) for m in day_meals),
-                "macros": self._calculate_daily_macros(day_meals)
+            "macroTargets": daily_targets(target_calories, medical_conditions, dietary_restrictions),
+            "variety": {
+                "window": user_profile.get("varietyWindow", DEFAULT_VARIETY_WINDOW),
+                "seed": user_profile.get("varietySeed", DEFAULT_VARIETY_SEED)
             }
+        }
+    
+    def _iter_plan_days(self, user_profile: Dict[str, Any], days: int) -> Iterator[Tuple[int, tuple]]:
+        """Yield (day number, meal IDs in MEAL_SLOTS order) for every day of a plan"""
+        goal = user_profile.get("goal", "maintenance")
+        medical_conditions = user_profile.get("medicalConditions", [])
+        dietary_restrictions = user_profile.get("dietaryRestrictions", [])
+        target_calories = resolve_target_calories(user_profile)
+        window = user_profile.get("varietyWindow", DEFAULT_VARIETY_WINDOW)
         
-        # Add shopping list
-        meal_plan["shoppingList"] = self._generate_shopping_list(meal_plan)
+        # Without a variety window selection is deterministic, so the day is solved once per plan
+        if window == 0:
+            day_ids = self._generate_daily_meals(target_calories, goal, medical_conditions, dietary_restrictions)
+            for day in range(days):
+                yield day, day_ids
+            return
         
-        # Add meal prep tips
-        meal_plan["mealPrepTips"] = self._get_meal_prep_tips(goal, medical_conditions)
-        
-        return meal_plan
+        # Candidate pools are ranked once; each day then only rotates through them
+        pools, targets = self._slot_pools(target_calories, medical_conditions, dietary_restrictions)
+        scheduler = VarietyScheduler(
+            [self.meal_store.nutrient_matrix([meal["id"] for meal in pool]) for pool in pools],
+            targets,
+            window,
+            user_profile.get("varietySeed", DEFAULT_VARIETY_SEED)
+        )
+        for day in range(days):
+            choice = scheduler.next_day()
+            yield day, tuple(pool[position]["id"] for pool, position in zip(pools, choice))
+    
+    def plan_cache_key(self, user_profile: Dict[str, Any], days: int = 7) -> tuple:
+        """Get a canonical cache key covering only the profile fields a meal plan depends on"""
+        # Body measurements only matter through the calorie target they resolve to
+        return (
+            user_profile.get("goal", "maintenance"),
+            tuple(sorted(user_profile.get("medicalConditions", []))),
+            tuple(sorted(user_profile.get("dietaryRestrictions", []))),
+            resolve_target_calories(user_profile),
+            user_profile.get("varietyWindow", DEFAULT_VARIETY_WINDOW),
+            user_profile.get("varietySeed", DEFAULT_VARIETY_SEED),
+            days
+        )
+    
+    def _day_date(self, day: int) -> str:
+        """Get the display date of a plan day, counting from today"""
+        return (datetime.now() + timedelta(days=day)).strftime("%A, %B %d")
     
     def _generate_daily_meals(
         self,
@@ -278,104 +434,192 @@ class DietAIGenerator:
         goal: str,
         medical_conditions: List[str],
         dietary_restrictions: List[str]
-    ) -> List[Dict[str, Any]]:
-        """Generate meals for a single day"""
-        
-        daily_meals = []
+    ) -> tuple:
+        """Generate the meal IDs for a single day, choosing all slots together"""
+        pools, targets = self._slot_pools(target_calories, medical_conditions, dietary_restrictions)
         
-        # Breakfast (~25% of calories)
-        breakfast = self._select_meal(
-            self.meal_database["breakfast"],
-            target_calories * 0.25,
-            medical_conditions,
-            dietary_restrictions
-        )
-        daily_meals.append({"type": "breakfast", **breakfast})
-        
-        # Lunch (~35% of calories)
-        lunch = self._select_meal(
-            self.meal_database["lunch"],
-            target_calories * 0.35,
-            medical_conditions,
-            dietary_restrictions
-        )
-        daily_meals.append({"type": "lunch", **lunch})
-        
-        # Snack (~10% of calories)
-        snack = self._select_meal(
-            self.meal_database["snacks"],
-            target_calories * 0.10,
-            medical_conditions,
-            dietary_restrictions
-        )
-        daily_meals.append({"type": "snack", **snack})
-        
-        # Dinner (~30% of calories)
-        dinner = self._select_meal(
-            self.meal_database["dinner"],
-            target_calories * 0.30,
-            medical_conditions,
-            dietary_restrictions
+        # The remaining-budget pick leads every pool and seeds the search
+        choice, _ = optimize_day(
+            [self.meal_store.nutrient_matrix([meal["id"] for meal in pool]) for pool in pools],
+            targets,
+            incumbent=(0, 0, 0, 0)
         )
-        daily_meals.append({"type": "dinner", **dinner})
         
-        return daily_meals
+        return tuple(pool[position]["id"] for pool, position in zip(pools, choice))
     
-    def _select_meal(
+    def _day_meals(self, day_ids: tuple) -> List[Dict[str, Any]]:
+        """Get a day's meals as dicts tagged with their slot"""
+        return [{"type": slot, **thaw(self.meal_store.meal(meal_id))} for (slot, _, _), meal_id in zip(MEAL_SLOTS, day_ids)]
+    
+    def _encoded_meals(self, day_ids: tuple) -> bytes:
+        """Get a day's meals as a JSON array, spliced from the catalog's records"""
+        records = self.meal_store.records(day_ids)
+        return b"[" + b",".join(prefix + record[1:] for prefix, record in zip(_SLOT_FRAGMENTS, records)) + b"]"
+    
+    def _slot_pools(
         self,
-        meals: List[Dict[str, Any]],
+        target_calories: int,
+        medical_conditions: List[str],
+        dietary_restrictions: List[str]
+    ) -> Tuple[List[List[Dict[str, Any]]], np.ndarray]:
+        """Get every slot's ranked candidate meals and the day's nutrient target vector"""
+        
+        targets = daily_targets(target_calories, medical_conditions, dietary_restrictions)
+        
+        # Candidate pools start from each slot's share of the day's calories, then add the
+        # meals closest to the slot's share of the macro targets
+        pools = []
+        for _, meal_type, share in MEAL_SLOTS:
+            pool = self._candidate_meals(
+                meal_type,
+                target_calories * share,
+                medical_conditions,
+                dietary_restrictions,
+                CANDIDATES_PER_SLOT
+            )
+            pooled = {meal["id"] for meal in pool}
+            pool += [
+                meal for meal in self._macro_candidates(
+                    meal_type,
+                    {field: targets[field] * share for field in MACRO_AXES},
+                    medical_conditions,
+                    dietary_restrictions,
+                    MACRO_CANDIDATES_PER_SLOT
+                )
+                if meal["id"] not in pooled
+            ]
+            pools.append(pool)
+        
+        # Fill the slots in order, each from its share of the macros still left in the day.
+        # That greedy day leads the ranked pools, so it seeds the optimizer and the scheduler
+        remaining = {field: float(targets[field]) for field in MACRO_AXES}
+        remaining_share = 1.0
+        for pool, (_, meal_type, share) in zip(pools, MEAL_SLOTS):
+            budget = {field: max(remaining[field], 0.0) * share / remaining_share for field in MACRO_AXES}
+            meal = self._select_meal(meal_type, budget, medical_conditions, dietary_restrictions)
+            pool[:] = [meal] + [candidate for candidate in pool if candidate["id"] != meal["id"]]
+            for field in MACRO_AXES:
+                remaining[field] -= meal[field]
+            remaining_share -= share
+        
+        return pools, np.array([targets[field] for field in NUTRIENTS], dtype=float)
+    
+    def _candidate_meals(
+        self,
+        meal_type: str,
         target_calories: float,
         medical_conditions: List[str],
+        dietary_restrictions: List[str],
+        count: int
+    ) -> List[Dict[str, Any]]:
+        """Get the suitable meals closest to a caloric target, closest first"""
+        index = self.meal_index[meal_type]
+        return index.k_nearest(target_calories, self._slot_mask(index, medical_conditions, dietary_restrictions), count)
+    
+    def _macro_candidates(
+        self,
+        meal_type: str,
+        macro_target: Dict[str, float],
+        medical_conditions: List[str],
+        dietary_restrictions: List[str],
+        count: int
+    ) -> List[Dict[str, Any]]:
+        """Get the suitable meals closest to a protein/carbs/fats target, closest first"""
+        index = self.meal_index[meal_type]
+        mask = self._slot_mask(index, medical_conditions, dietary_restrictions)
+        return [meal for _, meal in index.macro_nearest([macro_target[field] for field in MACRO_AXES], mask, count)]
+    
+    def _select_meal(
+        self,
+        meal_type: str,
+        macro_budget: Dict[str, float],
+        medical_conditions: List[str],
         dietary_restrictions: List[str]
     ) -> Dict[str, Any]:
-        """Select a meal based on caloric target and restrictions"""
+        """Select the meal that best fills a macro budget, such as a slot's share of what is left of the day"""
         
-        # Filter suitable meals
-        suitable_meals = []
-        for meal in meals:
-            compatible = True
-            
-            # Check dietary restrictions
-            if "Vegan" in dietary_restrictions and "vegan_friendly" not in meal["suitableFor"]:
-                compatible = False
-            if "Keto" in dietary_restrictions and "keto_friendly" not in meal["suitableFor"]:
-                compatible = False
-            
-            # Check medical conditions
-            if "Diabetes" in medical_conditions and "diabetes_friendly" not in meal["suitableFor"]:
-                if meal["carbs"] > 50:  # High carbs problematic for diabetics
-                    compatible = False
-            
-            if compatible:
-                suitable_meals.append(meal)
+        # Return meal closest to the budget in macro space
+        return self._macro_candidates(meal_type, macro_budget, medical_conditions, dietary_restrictions, 1)[0]
+    
+    def _slot_mask(
+        self,
+        index: MealIndex,
+        medical_conditions: List[str],
+        dietary_restrictions: List[str]
+    ) -> int:
+        """Get the mask of meals a slot may choose from"""
+        mask = self._suitable_mask(index, medical_conditions, dietary_restrictions)
         
         # If no suitable meals, use original list
-        if not suitable_meals:
-            suitable_meals = meals
+        if not mask:
+            mask = index.all_mask & ~index.tag_mask(VARIANT_TAG)
         
-        # Return meal closest to target calories
-        return min(suitable_meals, key=lambda x: abs(x["calories"] - target_calories))
+        return mask
     
-    def _calculate_daily_macros(self, meals: List[Dict[str, Any]]) -> Dict[str, float]:
-        """Calculate daily macro totals"""
-        return {
-            "protein": sum(m.get("protein", 0) for m in meals),
-            "carbs": sum(m.get("carbs", 0) for m in meals),
-            "fats": sum(m.get("fats", 0) for m in meals),
-            "calories": sum(m.get("calories", 0) for m in meals)
-        }
+    def _suitable_mask(
+        self,
+        index: MealIndex,
+        medical_conditions: List[str],
+        dietary_restrictions: List[str]
+    ) -> int:
+        """Get the mask of meals compatible with the user's restrictions and conditions"""
+        
+        # Check dietary restrictions
+        mask = index.all_of(
+            tag for restriction, tag in RESTRICTION_TAGS.items() if restriction in dietary_restrictions
+        )
+        
+        # Swapped variants are only offered for the restrictions that asked for their swaps
+        requested = {RESTRICTION_SWAP_PROFILES[r] for r in dietary_restrictions if r in RESTRICTION_SWAP_PROFILES}
+        for profile in SWAP_PROFILES:
+            if profile not in requested:
+                mask &= ~index.tag_mask(profile_tag(profile))
+        
+        # Check medical conditions: high carbs are problematic for diabetics
+        if "Diabetes" in medical_conditions:
+            mask &= ~(index.high_carb_mask & ~index.tag_mask("diabetes_friendly"))
+        
+        return mask
     
-    def _generate_shopping_list(self, meal_plan: Dict[str, Any]) -> List[str]:
-        """Generate shopping list from meal plan"""
-        ingredients = set()
+    def _calculate_plan_macros(self, day_ids: List[List[int]]) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """Calculate daily macro totals and whole-plan totals from a (days, meals) ID matrix"""
+        if not day_ids:
+            return [], {field: 0 for field in MACRO_FIELDS}
         
+        daily = self.meal_store.totals(np.array(day_ids), axis=1)
+        columns = {field: daily[field].tolist() for field in MACRO_FIELDS}
+        daily_macros = [
+            {field: columns[field][day] for field in MACRO_FIELDS}
+            for day in range(len(day_ids))
+        ]
+        plan_totals = {field: daily[field].sum().item() for field in MACRO_FIELDS}
+        return daily_macros, plan_totals
+    
+    def count_plan_ingredients(self, meal_plan: Dict[str, Any]) -> Counter:
+        """Count servings of each ingredient across an uploaded meal plan"""
+        servings = Counter()
         for day_data in meal_plan["days"].values():
-            for meal in day_data["meals"]:
-                if "ingredients" in meal:
-                    for ingredient in meal["ingredients"]:
-                        ingredients.add(ingredient)
-        
-        return sorted(list(ingredients))
+            servings.update(self._count_meal_ingredients(day_data["meals"]))
+        return servings
+    
+    def count_meal_id_ingredients(self, meal_ids: List[int]) -> Counter:
+        """Count servings of each ingredient for a list of catalog meal IDs (repeats count again)"""
+        servings = Counter()
+        for meal_id, count in Counter(meal_ids).items():
+            for ingredient in self.meal_store.meal(meal_id).get("ingredients", []):
+                servings[ingredient] += count
+        return servings
+    
+    def _count_meal_ingredients(self, meals: List[Dict[str, Any]]) -> Counter:
+        """Count servings of each ingredient across a list of meals"""
+        return Counter(ingredient for meal in meals for ingredient in meal.get("ingredients", []))
+    
+    def categorize_shopping_list(self, items: List[str]) -> Dict[str, List[str]]:
+        """Group shopping list items into store sections"""
+        categorized = {section: [] for section in INGREDIENT_CATEGORIES}
+        for item in items:
+            categorized[categorize_ingredient(item)].append(item)
+        return categorized
     
     def _get_medical_notes(self, conditions: List[str]) -> List[str]:
         """Get medical notes based on conditions"""
@@ -419,120 +663,75 @@ class DietAIGenerator:
             "trainingFoodPairing": self._get_training_food_pairing(user_profile),
         }
     
+    def recommendations_json(self, user_profile: Dict[str, Any]) -> bytes:
+        """Encode generate_ai_recommendations' result, splicing in the pre-encoded static sections"""
+        fragments = self._recommendation_fragments
+        hydration = {"dailyTarget": encode_json(self._hydration_target(user_profile)), **fragments["hydrationPlan"]}
+        return splice_object({
+            "personalizedTips": fragments["personalizedTips"].get(
+                user_profile.get("goal", "maintenance"), fragments["personalizedTips"]["maintenance"]
+            ),
+            "hydrationPlan": splice_object(hydration),
+            "supplementRecommendations": fragments["supplementRecommendations"][
+                "Vegan" in user_profile.get("dietaryRestrictions", [])
+            ],
+            "trainingFoodPairing": fragments["trainingFoodPairing"],
+        })
+    
+    @cached_property
+    def _recommendation_fragments(self) -> Dict[str, Any]:
+        """Encode every recommendation section that does not depend on the profile"""
+        return {
+            "personalizedTips": {goal: encode_json(tips) for goal, tips in GOAL_TIPS.items()},
+            "hydrationPlan": {"schedule": encode_json(HYDRATION_SCHEDULE), "tips": encode_json(HYDRATION_TIPS)},
+            "supplementRecommendations": {
+                False: encode_json(UNIVERSAL_SUPPLEMENTS),
+                True: encode_json(UNIVERSAL_SUPPLEMENTS + VEGAN_SUPPLEMENTS),
+            },
+            "trainingFoodPairing": encode_json(TRAINING_FOOD_PAIRING),
+        }
+    
     def _generate_personalized_tips(self, profile: Dict[str, Any]) -> List[str]:
         """Generate personalized dietary tips"""
-        tips = []
         goal = profile.get("goal", "maintenance")
-        
-        if goal == "bulking":
-            tips = [
-                "Eat 300-500 calories in surplus daily",
-                "Prioritize protein (1.6-2.2g per kg body weight)",
-                "Include calorie-dense foods like nuts, seeds, and oils",
-                "Don't neglect vegetables for micronutrients",
-                "Eat every 3-4 hours to maintain caloric surplus"
-            ]
-        elif goal == "cutting":
-            tips = [
-                "Create a 300-500 calorie deficit daily",
-                "Prioritize high-protein foods for satiety",
-                "Load up on vegetables (low calorie, high volume)",
-                "Stay hydrated to reduce false hunger signals",
-                "Schedule cheat meals 1x per week for adherence"
-            ]
-        else:  # Maintenance
-            tips = [
-                "Balance all three macronutrients",
-                "Eat intuitively when hungry, stop when satisfied",
-                "Include variety to ensure micronutrient coverage",
-                "Practice mindful eating",
-                "Adjust calories if body composition changes"
-            ]
-        
-        return tips
+        return list(GOAL_TIPS.get(goal, GOAL_TIPS["maintenance"]))
     
-    def _generate_hydration_plan(self, profile: Dict[str, Any]) -> Dict[str, Any]:
-        """Generate hydration recommendations"""
+    def _hydration_target(self, profile: Dict[str, Any]) -> str:
+        """Get the daily water target, scaled by body weight and activity"""
         weight_kg = profile.get("weight", 70)
         activity_level = profile.get("activityLevel", "moderate")
         
-        base_water = weight_kg * 35  # ml per day
-        activity_multiplier = {
-            "sedentary": 1.0,
-            "light": 1.1,
-            "moderate": 1.2,
-            "active": 1.3,
-            "very_active": 1.4
-        }.get(activity_level, 1.2)
+        base_water = weight_kg * HYDRATION_ML_PER_KG
+        activity_multiplier = HYDRATION_ACTIVITY_MULTIPLIERS.get(activity_level, DEFAULT_HYDRATION_MULTIPLIER)
         
         total_water = base_water * activity_multiplier
-        
+        return f"{total_water/1000:.1f}L"
+    
+    def _generate_hydration_plan(self, profile: Dict[str, Any]) -> Dict[str, Any]:
+        """Generate hydration recommendations"""
         return {
-            "dailyTarget": f"{total_water/1000:.1f}L",
-            "schedule": [
-                "💧 Morning: 500ml with breakfast",
-                "💧 Mid-morning: 250ml with snack",
-                "💧 Lunch: 500ml",
-                "💧 Afternoon: 250ml with snack",
-                "💧 Dinner: 500ml",
-                "💧 Evening: 250ml"
-            ],
-            "tips": [
-                "Drink water before meals to aid digestion",
-                "Add electrolytes on workout days",
-                "Monitor urine color (should be light yellow)"
-            ]
+            "dailyTarget": self._hydration_target(profile),
+            "schedule": list(HYDRATION_SCHEDULE),
+            "tips": list(HYDRATION_TIPS)
         }
     
     def _get_supplement_recommendations(self, profile: Dict[str, Any]) -> List[Dict[str, str]]:
         """Get supplement recommendations"""
         dietary_restrictions = profile.get("dietaryRestrictions", [])
-        recommendations = []
-        
-        # Universal recommendations
-        recommendations.append({
-            "supplement": "Vitamin D",
-            "dosage": "1000-2000 IU",
-            "reason": "Essential for bone health and immunity"
-        })
-        
-        recommendations.append({
-            "supplement": "Omega-3 Fish Oil",
-            "dosage": "1-2g EPA+DHA",
-            "reason": "Anti-inflammatory, heart health"
-        })
+        recommendations = UNIVERSAL_SUPPLEMENTS
         
         # Condition-specific
         if "Vegan" in dietary_restrictions:
-            recommendations.append({
-                "supplement": "Vitamin B12",
-                "dosage": "1000-2000 mcg weekly",
-                "reason": "Not naturally found in plant-based foods"
-            })
-            recommendations.append({
-                "supplement": "Iron",
-                "dosage": "18mg",
-                "reason": "Plant-based iron has lower bioavailability"
-            })
-        
-        return recommendations
-    
-    def _get_training_food_pairing(self, profile: Dict[str, Any]) -> Dict[str, List[str]]:
+            recommendations = recommendations + VEGAN_SUPPLEMENTS
+        
+        return [dict(recommendation) for recommendation in recommendations]
+    
+    def _get_training_food_pairing(self, profile: Dict[str, Any]) -> Dict[str, Any]:
         """Get optimal food timing around workouts"""
         return {
-            "preWorkout": [
-                "30-60 min before: Banana with almond butter",
-                "30-60 min before: Rice cakes with honey",
-                "Choose easily digestible carbs + small protein"
-            ],
-            "postWorkout": [
-                "Within 30 min: Protein shake with fruit",
-                "Within 2 hours: Full meal with protein + carbs",
-                "Example: Chicken with rice and vegetables"
-            ],
-            "timing": "These windows optimize recovery and performance"
+            section: list(value) if isinstance(value, list) else value
+            for section, value in TRAINING_FOOD_PAIRING.items()
         }
 
-
 # Export the generator
 diet_generator = DietAIGenerator()
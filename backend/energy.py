@@ -0,0 +1,169 @@
+"""
+Energy and Macro Targets
+Mifflin-St Jeor BMR, TDEE and macro splits, ported from the app's src/utils/calculations.ts
+
+Every function works on whole arrays, so the targets of a cohort of profiles are
+computed in one call.
+"""
+
+import math
+from typing import Dict, List, Any, Optional, Sequence
+import numpy as np
+
+# Activity level multipliers
+ACTIVITY_MULTIPLIERS = {
+    "sedentary": 1.2,
+    "light": 1.375,
+    "moderate": 1.55,
+    "active": 1.725,
+    "very_active": 1.9,
+}
+DEFAULT_ACTIVITY_MULTIPLIER = 1.55
+
+# Goal-based caloric adjustments
+GOAL_CALORIC_ADJUSTMENTS = {
+    "bulking": 300,
+    "cutting": -400,
+    "maintenance": 0,
+}
+
+# Used when a profile has neither targetCalories nor the body measurements to derive it
+DEFAULT_TARGET_CALORIES = 2000
+
+# Calorie targets outside this range are not planned for; derived targets are clamped into it
+MIN_TARGET_CALORIES = 1200
+MAX_TARGET_CALORIES = 10000
+
+# Body measurements the target is derived from
+MEASUREMENT_FIELDS = ("weight", "height", "age")
+
+# Base (protein, carbs, fats) shares of calories
+BASE_MACRO_RATIOS = (0.30, 0.45, 0.25)
+
+# Ratio overrides as (profile field, value, ratios); later matches win, as in the app
+MACRO_RATIO_RULES = [
+    ("medicalConditions", "Diabetes", (0.35, 0.35, 0.30)),
+    ("medicalConditions", "Hypertension", (0.35, 0.40, 0.25)),
+    ("dietaryRestrictions", "Vegan", (0.35, 0.45, 0.20)),
+    ("dietaryRestrictions", "Keto", (0.25, 0.05, 0.70)),
+]
+
+# Calories per gram of (protein, carbs, fats)
+KCAL_PER_GRAM = np.array([4.0, 4.0, 9.0])
+
+
+def _round_half_up(values: Any) -> np.ndarray:
+    """Round like JavaScript's Math.round, so targets match the app's"""
+    return np.floor(np.asarray(values, dtype=float) + 0.5)
+
+
+def _is_number(value: Any) -> bool:
+    """Check that a JSON value is a finite number (booleans are not numbers here)"""
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def measurement_error(profile: Dict[str, Any]) -> Optional[str]:
+    """Get why a profile's body measurements or targetCalories cannot be used, if they cannot"""
+    for field in MEASUREMENT_FIELDS:
+        if field in profile and not (_is_number(profile[field]) and profile[field] > 0):
+            return f"{field} must be a positive number"
+    if "targetCalories" in profile:
+        target = profile["targetCalories"]
+        if not (_is_number(target) and MIN_TARGET_CALORIES <= target <= MAX_TARGET_CALORIES):
+            return f"targetCalories must be a number between {MIN_TARGET_CALORIES} and {MAX_TARGET_CALORIES}"
+    return None
+
+
+def calculate_bmr(weight: Any, height: Any, age: Any, is_male: Any) -> np.ndarray:
+    """Calculate Basal Metabolic Rate with the Mifflin-St Jeor equation"""
+    base = 10 * np.asarray(weight, dtype=float) + 6.25 * np.asarray(height, dtype=float) - 5 * np.asarray(age, dtype=float)
+    return base + np.where(np.asarray(is_male, dtype=bool), 5.0, -161.0)
+
+
+def calculate_tdee(bmr: Any, activity_multiplier: Any) -> np.ndarray:
+    """Calculate Total Daily Energy Expenditure, rounded to whole calories"""
+    return _round_half_up(np.asarray(bmr, dtype=float) * np.asarray(activity_multiplier, dtype=float))
+
+
+def calculate_target_calories(profiles: Sequence[Dict[str, Any]]) -> np.ndarray:
+    """Derive the daily calorie target of every profile from its body measurements
+
+    Profiles missing weight, height or age get DEFAULT_TARGET_CALORIES; an explicit
+    targetCalories is ignored here (see target_calories). Derived targets are clamped
+    to MIN_TARGET_CALORIES-MAX_TARGET_CALORIES. Measurements that are not numbers raise
+    ValueError; check profiles with measurement_error first.
+    """
+    measured = np.array([all(field in profile for field in MEASUREMENT_FIELDS) for profile in profiles], dtype=bool)
+    weight, height, age = (
+        np.array([profile.get(field, 0) if has else 0 for profile, has in zip(profiles, measured)], dtype=float)
+        for field in MEASUREMENT_FIELDS
+    )
+    is_male = np.array([profile.get("gender") == "male" for profile in profiles], dtype=bool)
+    activity = np.array(
+        [ACTIVITY_MULTIPLIERS.get(profile.get("activityLevel"), DEFAULT_ACTIVITY_MULTIPLIER) for profile in profiles]
+    )
+    adjustment = np.array([GOAL_CALORIC_ADJUSTMENTS.get(profile.get("goal"), 0) for profile in profiles], dtype=float)
+
+    tdee = calculate_tdee(calculate_bmr(weight, height, age, is_male), activity)
+    derived = np.where(measured, tdee + adjustment, DEFAULT_TARGET_CALORIES)
+    if not np.isfinite(derived).all():
+        raise ValueError("weight, height and age must be finite numbers")
+    return np.clip(derived, MIN_TARGET_CALORIES, MAX_TARGET_CALORIES).astype(np.int64)
+
+
+def target_calories(profiles: Sequence[Dict[str, Any]]) -> List[Any]:
+    """Get every profile's calorie target: its own targetCalories if given, else the derived one"""
+    derived = calculate_target_calories(profiles).tolist()
+    return [profile["targetCalories"] if "targetCalories" in profile else calories for profile, calories in zip(profiles, derived)]
+
+
+def resolve_target_calories(profile: Dict[str, Any]) -> Any:
+    """Get one profile's calorie target"""
+    return target_calories([profile])[0]
+
+
+def macro_ratios(medical_conditions: Sequence[List[str]], dietary_restrictions: Sequence[List[str]]) -> np.ndarray:
+    """Get the (n, 3) protein/carb/fat calorie shares for n condition and restriction lists"""
+    ratios = np.tile(np.array(BASE_MACRO_RATIOS), (len(medical_conditions), 1))
+    lists = {"medicalConditions": medical_conditions, "dietaryRestrictions": dietary_restrictions}
+    for field, value, rule_ratios in MACRO_RATIO_RULES:
+        matches = np.array([value in entries for entries in lists[field]], dtype=bool)
+        ratios[matches] = rule_ratios
+    return ratios
+
+
+def macro_grams(calories: Any, ratios: Any) -> np.ndarray:
+    """Get the (n, 3) protein/carb/fat gram targets for n calorie targets and ratio rows"""
+    calories = np.asarray(calories, dtype=float).reshape(-1, 1)
+    return _round_half_up(calories * np.asarray(ratios, dtype=float) / KCAL_PER_GRAM)
+
+
+def daily_targets(
+    target_calories: Any,
+    medical_conditions: List[str],
+    dietary_restrictions: List[str]
+) -> Dict[str, Any]:
+    """Get one day's calorie and macro targets in grams"""
+    protein, carbs, fats = macro_grams(target_calories, macro_ratios([medical_conditions], [dietary_restrictions]))[0].tolist()
+    return {
+        "calories": target_calories,
+        "protein": int(protein),
+        "carbs": int(carbs),
+        "fats": int(fats)
+    }
+
+
+def cohort_targets(profiles: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Get the daily calorie and macro targets of a whole cohort of profiles in one pass"""
+    calories = target_calories(profiles)
+    grams = macro_grams(
+        calories,
+        macro_ratios(
+            [profile.get("medicalConditions", []) for profile in profiles],
+            [profile.get("dietaryRestrictions", []) for profile in profiles]
+        )
+    ).astype(np.int64).tolist()
+    return [
+        {"calories": target, "protein": protein, "carbs": carbs, "fats": fats}
+        for target, (protein, carbs, fats) in zip(calories, grams)
+    ]
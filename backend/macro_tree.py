@@ -0,0 +1,124 @@
+"""
+Macro-Space Nearest Neighbours
+K-d tree over meals' (protein, carbs, fats) so the meals closest to a macro target are found in logarithmic time
+"""
+
+import heapq
+from typing import List, Optional, Tuple
+import numpy as np
+
+# Macro fields indexed by the tree, with the calories per gram that scale each axis
+MACRO_AXES = ("protein", "carbs", "fats")
+MACRO_KCAL_PER_GRAM = np.array([4.0, 4.0, 9.0])
+
+# Points stored per leaf
+LEAF_SIZE = 16
+
+
+class MacroTree:
+    """K-d tree over macro vectors, with distances in calories
+
+    Points are scaled by calories per gram, so a gram of fat counts as much as 2.25
+    grams of protein. Nodes live in flat arrays: each node covers a contiguous slice of
+    the reordered points and keeps its bounding box for pruning. Queries can be
+    restricted to a subset of the points, so one tree serves every filter.
+    """
+
+    def __init__(self, macros: np.ndarray, labels: np.ndarray, tie_breaks: np.ndarray):
+        """Build the tree over (n, 3) gram macros; labels are returned from queries, tie_breaks order equal distances"""
+        points = np.asarray(macros, dtype=float).reshape(-1, len(MACRO_AXES)) * MACRO_KCAL_PER_GRAM
+        order = np.arange(len(points))
+        self._lows: List[np.ndarray] = []
+        self._highs: List[np.ndarray] = []
+        self._children: List[Tuple[int, int]] = []
+        self._slices: List[Tuple[int, int]] = []
+
+        if len(points):
+            # Split iteratively instead of recursively; each pending entry is (node, start, end)
+            self._add_node(points, order, 0, len(points))
+            pending = [(0, 0, len(points))]
+            while pending:
+                node, start, end = pending.pop()
+                if end - start <= LEAF_SIZE:
+                    continue
+                block = points[order[start:end]]
+                axis = int(np.argmax(block.max(axis=0) - block.min(axis=0)))
+                middle = (end - start) // 2
+                split = np.argpartition(block[:, axis], middle)
+                order[start:end] = order[start:end][split]
+                left = self._add_node(points, order, start, start + middle)
+                right = self._add_node(points, order, start + middle, end)
+                self._children[node] = (left, right)
+                pending += [(left, start, start + middle), (right, start + middle, end)]
+
+        self.order = order
+        self.points = points[order]
+        self.labels = np.asarray(labels)[order]
+        self.tie_breaks = np.asarray(tie_breaks)[order].tolist()
+        # Boxes are three numbers each, so plain tuples beat NumPy calls in the query loop
+        self.boxes = [tuple(zip(low.tolist(), high.tolist())) for low, high in zip(self._lows, self._highs)]
+
+    def _add_node(self, points: np.ndarray, order: np.ndarray, start: int, end: int) -> int:
+        """Append a node over the points order[start:end] and return its number"""
+        block = points[order[start:end]]
+        self._lows.append(block.min(axis=0))
+        self._highs.append(block.max(axis=0))
+        self._children.append((-1, -1))
+        self._slices.append((start, end))
+        return len(self._slices) - 1
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    def _box_distance(self, node: int, target: List[float]) -> float:
+        """Get the squared distance from a target to a node's bounding box"""
+        total = 0.0
+        for value, (low, high) in zip(target, self.boxes[node]):
+            gap = low - value if value < low else value - high if value > high else 0.0
+            total += gap * gap
+        return total
+
+    def query(self, macros: np.ndarray, k: int, included: Optional[np.ndarray] = None) -> List[Tuple[float, int]]:
+        """Find the k points closest to a (protein, carbs, fats) gram target
+
+        `included` is an optional boolean array in the order the points were given;
+        points it leaves out are skipped, along with any subtree holding none of the
+        included points. Returns (distance in calories, label) pairs, closest first;
+        equal distances keep tie-break order.
+        """
+        if not len(self.points) or k < 1:
+            return []
+        kept = None if included is None else np.asarray(included, dtype=bool)[self.order]
+        # Running counts of kept rows tell in O(1) whether a node's slice holds any
+        counts = None if kept is None else np.concatenate(([0], np.cumsum(kept)))
+        if counts is not None and not counts[-1]:
+            return []
+        target_array = np.asarray(macros, dtype=float) * MACRO_KCAL_PER_GRAM
+        target = target_array.tolist()
+
+        # Best-first: always expand the node whose box is nearest, stop once it cannot beat the k-th result
+        frontier = [(self._box_distance(0, target), 0)]
+        found: List[Tuple[float, int, int]] = []
+        while frontier:
+            distance, node = heapq.heappop(frontier)
+            if len(found) == k and distance > -found[0][0]:
+                break
+            left, right = self._children[node]
+            if left >= 0:
+                for child in (left, right):
+                    start, end = self._slices[child]
+                    if counts is None or counts[end] > counts[start]:
+                        heapq.heappush(frontier, (self._box_distance(child, target), child))
+                continue
+
+            start, end = self._slices[node]
+            rows = np.arange(start, end) if kept is None else start + np.flatnonzero(kept[start:end])
+            offsets = self.points[rows] - target_array
+            for row, squared in zip(rows.tolist(), np.einsum("ij,ij->i", offsets, offsets).tolist()):
+                entry = (-squared, -self.tie_breaks[row], row)
+                if len(found) < k:
+                    heapq.heappush(found, entry)
+                elif entry > found[0]:
+                    heapq.heapreplace(found, entry)
+
+        return [(float(np.sqrt(-negative)), self.labels[row].item()) for negative, _, row in sorted(found, reverse=True)]
@@ -0,0 +1,198 @@
+"""
+Meal Catalog Indexes
+Precomputed lookup structures over a meal category so plan generation never has to scan the catalog
+"""
+
+import threading
+from bisect import bisect_left
+from typing import Dict, List, Any, Iterator, Iterable, Optional, Sequence, Tuple
+import numpy as np
+
+from catalog import CatalogCategory, pack_mask, unpack_mask
+from macro_tree import MACRO_AXES, MacroTree
+
+# Meals above this many grams of carbs are filtered out for diabetic users unless tagged diabetes_friendly
+DIABETES_CARB_LIMIT = 50
+
+
+def iter_positions(mask: int) -> Iterator[int]:
+    """Yield the positions of the set bits in a mask, lowest first"""
+    while mask:
+        low_bit = mask & -mask
+        yield low_bit.bit_length() - 1
+        mask ^= low_bit
+
+
+def mask_flags(mask: int, size: int) -> np.ndarray:
+    """Get a mask over `size` entries as a boolean array (entry i is bit i)"""
+    packed = np.frombuffer(mask.to_bytes((size + 7) // 8, "little"), dtype=np.uint8)
+    return np.unpackbits(packed, bitorder="little")[:size].astype(bool)
+
+
+def highest_position(mask: int) -> int:
+    """Get the position of the highest set bit of a non-empty mask"""
+    return mask.bit_length() - 1
+
+
+def lowest_position(mask: int) -> int:
+    """Get the position of the lowest set bit of a non-empty mask"""
+    return (mask & -mask).bit_length() - 1
+
+
+class MealIndex:
+    """Bitmask index over the meals of a single category, kept sorted by calories
+
+    Bit positions are ranks in calorie order (ties broken by catalog order), so a
+    nearest-calorie lookup is a bisect followed by a scan for the closest set bit.
+    The compiled catalog already stores each category in that order with its tag
+    bitmasks, so building the index never decodes a meal record.
+    """
+
+    def __init__(self, meals: CatalogCategory):
+        self.meals = meals
+        self.calories = meals.column("calories").tolist()
+        # Meal IDs are assigned in catalog order, so they break ties the way the catalog lists meals
+        self.catalog_order = meals.column("id").tolist()
+        self.all_mask = (1 << len(meals)) - 1
+        self.tag_masks: Dict[str, int] = meals.tag_masks()
+        self.high_carb_mask = unpack_mask(pack_mask(meals.column("carbs") > DIABETES_CARB_LIMIT))
+        self._sorted_columns: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._macro_tree: Optional[MacroTree] = None
+        self._macro_tree_lock = threading.Lock()
+
+    def tag_mask(self, tag: str) -> int:
+        """Get the mask of meals carrying a suitableFor tag"""
+        return self.tag_masks.get(tag, 0)
+
+    def all_of(self, tags: Iterable[str]) -> int:
+        """Get the mask of meals carrying every one of the given tags"""
+        mask = self.all_mask
+        for tag in tags:
+            mask &= self.tag_masks.get(tag, 0)
+        return mask
+
+    def any_of(self, tags: Iterable[str]) -> int:
+        """Get the mask of meals carrying at least one of the given tags"""
+        mask = 0
+        for tag in tags:
+            mask |= self.tag_masks.get(tag, 0)
+        return mask
+
+    def range_mask(self, field: str, low: Optional[float] = None, high: Optional[float] = None) -> int:
+        """Get the mask of meals whose numeric column lies within [low, high]"""
+        values, order = self._sorted_column(field)
+        start = 0 if low is None else int(np.searchsorted(values, low, side="left"))
+        end = len(values) if high is None else int(np.searchsorted(values, high, side="right"))
+        if start >= end:
+            return 0
+        if field == "calories":
+            # Positions are calorie ranks, so a calorie range is one run of bits
+            return ((1 << (end - start)) - 1) << start
+        flags = np.zeros(len(values), dtype=bool)
+        flags[order[start:end]] = True
+        return unpack_mask(pack_mask(flags))
+
+    def _sorted_column(self, field: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Get a column's values in ascending order with their positions, built on first use"""
+        if field not in self._sorted_columns:
+            column = self.meals.column(field)
+            order = np.argsort(column, kind="stable")
+            self._sorted_columns[field] = (column[order], order)
+        return self._sorted_columns[field]
+
+    def page(self, mask: int, start: int, limit: int) -> Tuple[List[int], Optional[int]]:
+        """Get up to `limit` positions of a mask from `start` on, plus where the next page starts"""
+        mask = mask >> start << start
+        positions = []
+        while mask and len(positions) < limit:
+            position = lowest_position(mask)
+            positions.append(position)
+            mask ^= 1 << position
+        return positions, (positions[-1] + 1 if mask else None)
+
+    def records(self, positions: Sequence[int], fields: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+        """Get meals at positions, optionally projected onto a subset of fields
+
+        Projections onto numeric columns only are served from the columns, without decoding
+        any meal record.
+        """
+        if fields is None:
+            return [self.meals[position] for position in positions]
+        if set(fields) <= set(self.meals.columns):
+            columns = {field: self.meals.column(field)[list(positions)].tolist() for field in fields}
+            return [{field: columns[field][i] for field in fields} for i in range(len(positions))]
+        return [
+            {field: meal[field] for field in fields if field in meal}
+            for meal in (self.meals[position] for position in positions)
+        ]
+
+    def select(self, mask: int) -> List[Dict[str, Any]]:
+        """Materialise the meals in a mask, in calorie order"""
+        return [self.meals[position] for position in iter_positions(mask)]
+
+    def nearest(self, target_calories: float, mask: int) -> Optional[Dict[str, Any]]:
+        """Find the meal in a mask closest to a calorie target
+
+        Ties resolve to the meal listed first in the catalog, matching a linear
+        min() over the original list.
+        """
+        closest = self.k_nearest(target_calories, mask, 1)
+        return closest[0] if closest else None
+
+    def k_nearest(self, target_calories: float, mask: int, k: int) -> List[Dict[str, Any]]:
+        """Find up to k meals in a mask closest to a calorie target, closest first
+
+        Ties resolve to the meal listed first in the catalog. Equal-calorie meals sit in
+        catalog order, so below the target each run is entered from its start.
+        """
+        mask &= self.all_mask
+        split = bisect_left(self.calories, target_calories)
+        below = mask & ((1 << split) - 1)
+        above = mask >> split << split
+        result = []
+
+        while len(result) < k and (below or above):
+            candidates = []
+            if below:
+                candidates.append(self._first_of_run(below))
+            if above:
+                candidates.append(lowest_position(above))
+
+            position = min(
+                candidates,
+                key=lambda p: (abs(self.calories[p] - target_calories), self.catalog_order[p])
+            )
+            if position < split:
+                below ^= 1 << position
+            else:
+                above ^= 1 << position
+            result.append(self.meals[position])
+
+        return result
+
+    def macro_tree(self) -> MacroTree:
+        """Get the (protein, carbs, fats) k-d tree over every meal of the category, built on first use
+
+        One tree serves every filter: queries pass their mask and the tree skips
+        meals outside it, so arbitrary tag combinations never cost a rebuild.
+        """
+        with self._macro_tree_lock:
+            if self._macro_tree is None:
+                positions = np.arange(len(self.meals))
+                macros = np.stack([self.meals.column(field) for field in MACRO_AXES], axis=1)
+                self._macro_tree = MacroTree(macros, positions, np.asarray(self.catalog_order))
+            return self._macro_tree
+
+    def macro_nearest(self, macros: Sequence[float], mask: int, k: int) -> List[Tuple[float, Dict[str, Any]]]:
+        """Find up to k meals in a mask closest to a (protein, carbs, fats) target, closest first
+
+        Returns (distance in calories, meal) pairs; ties resolve in catalog order.
+        """
+        included = mask_flags(mask & self.all_mask, len(self.meals))
+        return [(distance, self.meals[position]) for distance, position in self.macro_tree().query(macros, k, included)]
+
+    def _first_of_run(self, below: int) -> int:
+        """Get the catalog-first meal among the highest-calorie meals of a mask"""
+        # Equal-calorie meals sit in catalog order, so step back to the start of the run
+        run_start = bisect_left(self.calories, self.calories[highest_position(below)])
+        return run_start + lowest_position(below >> run_start)
@@ -0,0 +1,146 @@
+"""
+Joint Daily Meal Optimizer
+Chooses one meal per slot so the day's calories and macros land as close as possible to the targets
+
+The search is exact over the candidate pools it is given, but its cost grows steeply
+with pool size: about 2 ms at 24 meals per slot, 20 ms at 50, 150 ms at 100 and 2 s
+at 200. Callers keep pools small (see CANDIDATES_PER_SLOT in diet_ai), so the plan as
+a whole is a heuristic: meals outside the pools are never considered.
+"""
+
+from typing import List, Optional, Tuple
+import numpy as np
+
+# Nutrient vector layout shared by the optimizer and its callers
+NUTRIENTS = ("calories", "protein", "carbs", "fats")
+
+# Energy per gram, used to express macro errors in calories
+KCAL_PER_UNIT = np.array([1.0, 4.0, 4.0, 9.0])
+
+# Relative importance of hitting each nutrient target
+NUTRIENT_WEIGHTS = np.array([3.0, 1.0, 1.0, 1.0])
+
+# Number of pair sums grouped under one bounding box during branch-and-bound
+CHUNK_SIZE = 32
+
+# Number of first-half combinations bounded and scored per vectorized batch
+BATCH_ROWS = 256
+
+# Number of best-bounded first-half combinations scored exhaustively to seed the incumbent
+PROBE_ROWS = 8
+
+
+def _pair_sums(first: np.ndarray, second: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Sum every row of one pool with every row of another, keeping the source indices"""
+    sums = (first[:, None, :] + second[None, :, :]).reshape(-1, first.shape[1])
+    left, right = np.divmod(np.arange(len(first) * len(second)), len(second))
+    return sums, left, right
+
+
+def optimize_day(
+    pools: List[np.ndarray],
+    targets: np.ndarray,
+    incumbent: Optional[Tuple[int, int, int, int]] = None
+) -> Tuple[Tuple[int, int, int, int], float]:
+    """Pick one candidate from each of four pools minimising the day's weighted error
+
+    Each pool is a (candidates, 4) nutrient array. The error is the weighted sum of
+    squared deviations from the targets, with macros converted to calories and every
+    term scaled by the calorie target. The first two and last two pools are combined
+    into pair sums, and the second set is grouped into k-d tree leaf chunks with
+    bounding boxes so whole blocks of combinations are pruned before being scored.
+
+    Returns the chosen index into each pool and the error of that combination.
+    """
+    if any(len(pool) == 0 for pool in pools):
+        raise ValueError("Every meal slot needs at least one candidate")
+
+    scale = np.sqrt(NUTRIENT_WEIGHTS) * KCAL_PER_UNIT / max(float(targets[0]), 1.0)
+    scaled = [pool * scale for pool in pools]
+    goal = targets * scale
+
+    first_sums, first_a, first_b = _pair_sums(scaled[0], scaled[1])
+    second_sums, second_a, second_b = _pair_sums(scaled[2], scaled[3])
+
+    # What each first-half combination still needs from the second half
+    residuals = goal - first_sums
+
+    order = _leaf_order(second_sums, np.arange(len(second_sums)))
+    second_sums, second_a, second_b = second_sums[order], second_a[order], second_b[order]
+
+    best_error = np.inf
+    best = None
+    if incumbent is not None:
+        chosen = sum(scaled[slot][incumbent[slot]] for slot in range(4))
+        best_error = float(((chosen - goal) ** 2).sum())
+        best = tuple(incumbent)
+
+    # Bounding box of every chunk; padding rows can never win
+    starts = np.arange(0, len(second_sums), CHUNK_SIZE)
+    lows = np.minimum.reduceat(second_sums, starts, axis=0)
+    highs = np.maximum.reduceat(second_sums, starts, axis=0)
+    padded = np.full((len(starts) * CHUNK_SIZE, second_sums.shape[1]), np.inf)
+    padded[:len(second_sums)] = second_sums
+    blocks = padded.reshape(len(starts), CHUNK_SIZE, -1)
+
+    # Visit the most promising first-half rows first so the incumbent tightens early
+    row_bounds = _box_bound(residuals, lows.min(axis=0), highs.max(axis=0))
+    order = np.argsort(row_bounds, kind="stable")
+
+    # Score the few most promising rows against everything to get a tight incumbent
+    probe = order[:PROBE_ROWS]
+    errors = ((residuals[probe, None, :] - second_sums[None, :, :]) ** 2).sum(axis=2)
+    row, second = np.unravel_index(np.argmin(errors), errors.shape)
+    if errors[row, second] < best_error:
+        best_error = float(errors[row, second])
+        first = probe[row]
+        best = (
+            int(first_a[first]), int(first_b[first]),
+            int(second_a[second]), int(second_b[second])
+        )
+
+    for batch_start in range(len(probe), len(order), BATCH_ROWS):
+        rows = order[batch_start:batch_start + BATCH_ROWS]
+        if row_bounds[rows[0]] >= best_error:
+            break
+
+        # Only score the (row, chunk) pairs whose bound beats the incumbent
+        bounds = _box_bound(residuals[rows, None, :], lows[None, :, :], highs[None, :, :])
+        pair_rows, pair_chunks = np.nonzero(bounds < best_error)
+        if len(pair_rows) == 0:
+            continue
+
+        errors = ((residuals[rows[pair_rows], None, :] - blocks[pair_chunks]) ** 2).sum(axis=2)
+        pair, column = np.unravel_index(np.argmin(errors), errors.shape)
+        if errors[pair, column] < best_error:
+            best_error = float(errors[pair, column])
+            first = rows[pair_rows[pair]]
+            second = pair_chunks[pair] * CHUNK_SIZE + column
+            best = (
+                int(first_a[first]), int(first_b[first]),
+                int(second_a[second]), int(second_b[second])
+            )
+
+    return best, best_error
+
+
+def _leaf_order(points: np.ndarray, indices: np.ndarray) -> np.ndarray:
+    """Order points so that consecutive chunks form compact boxes (k-d tree leaves)"""
+    if len(indices) <= CHUNK_SIZE:
+        return indices
+
+    # Split on the widest dimension, keeping the split on a chunk boundary
+    subset = points[indices]
+    dimension = int(np.argmax(subset.max(axis=0) - subset.min(axis=0)))
+    indices = indices[np.argsort(subset[:, dimension], kind="stable")]
+    middle = max(CHUNK_SIZE, (len(indices) // 2) // CHUNK_SIZE * CHUNK_SIZE)
+    return np.concatenate([
+        _leaf_order(points, indices[:middle]),
+        _leaf_order(points, indices[middle:])
+    ])
+
+
+def _box_bound(points: np.ndarray, lows: np.ndarray, highs: np.ndarray) -> np.ndarray:
+    """Get the squared distance from points to axis-aligned boxes (broadcasting)"""
+    gaps = np.maximum(lows - points, 0.0) + np.maximum(points - highs, 0.0)
+    return (gaps ** 2).sum(axis=-1)
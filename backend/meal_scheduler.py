@@ -0,0 +1,61 @@
+"""
+Variety Scheduler
+Rotates multi-day plans through each slot's ranked candidates so meals do not repeat within a window
+"""
+
+import random
+from typing import List, Tuple
+import numpy as np
+
+from meal_optimizer import optimize_day
+
+# Candidates per slot offered to the optimizer on each day after the first
+VARIETY_SHORTLIST = 8
+
+
+class VarietyScheduler:
+    """Chooses each day's meals from fixed per-slot candidate pools without recent repeats
+
+    The pools are ranked (best first) and built once per plan, so every day only works
+    on small arrays: the first day is the best combination overall, and each later day
+    optimizes over a seeded sample of the candidates not served in that slot within the
+    last `window` days. The same seed always yields the same plan.
+    """
+
+    def __init__(self, pools: List[np.ndarray], targets: np.ndarray, window: int, seed: int):
+        self.pools = pools
+        self.targets = targets
+        self.window = window
+        self.random = random.Random(seed)
+        self.day = 0
+        self._last_served = [np.full(len(pool), -np.inf) for pool in pools]
+
+    def next_day(self) -> Tuple[int, ...]:
+        """Get the next day's choice as an index into each pool"""
+        if self.day == 0:
+            shortlists = [np.arange(len(pool)) for pool in self.pools]
+        else:
+            shortlists = [self._shortlist(last_served) for last_served in self._last_served]
+
+        # Shortlists keep rank order, so their first entries are the greedy pick that seeds the search
+        choice, _ = optimize_day(
+            [pool[shortlist] for pool, shortlist in zip(self.pools, shortlists)],
+            self.targets,
+            incumbent=(0,) * len(self.pools)
+        )
+        chosen = tuple(int(shortlist[position]) for shortlist, position in zip(shortlists, choice))
+        for last_served, position in zip(self._last_served, chosen):
+            last_served[position] = self.day
+        self.day += 1
+        return chosen
+
+    def _shortlist(self, last_served: np.ndarray) -> np.ndarray:
+        """Sample the candidates a slot may serve today, best-ranked eligible one first"""
+        eligible = np.flatnonzero(self.day - last_served > self.window)
+        if not len(eligible):
+            # Too few candidates to honour the window: fall back to the longest-rested ones
+            eligible = np.flatnonzero(last_served == last_served.min())
+
+        rest = eligible[1:].tolist()
+        sampled = self.random.sample(rest, min(VARIETY_SHORTLIST - 1, len(rest)))
+        return np.array([eligible[0]] + sorted(sampled))
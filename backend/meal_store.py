@@ -0,0 +1,131 @@
+"""
+Columnar Meal Store
+NumPy-backed copy of the meal catalog so nutrient totals are array operations over meal IDs
+"""
+
+from typing import Dict, List, Any, Sequence, Tuple
+import numpy as np
+
+from catalog import CatalogCategory
+from meal_optimizer import NUTRIENTS
+
+# Calories per gram of each macro, for calorie shares
+MACRO_KCAL = {"protein": 4, "carbs": 4, "fats": 9}
+
+# Meal IDs are kept in an int64 column, so larger ones can never name a meal
+MAX_MEAL_ID = int(np.iinfo(np.int64).max)
+
+
+def is_meal_id(value: Any) -> bool:
+    """Check whether a request value can be a meal ID: a non-negative integer, not a boolean, that fits the ID column"""
+    return isinstance(value, int) and not isinstance(value, bool) and 0 <= value <= MAX_MEAL_ID
+
+
+def sum_nutrients(meals: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+    """Total the nutrients of arbitrary meal dicts (missing fields count as zero) in one pass"""
+    if not meals:
+        return {field: 0 for field in NUTRIENTS}
+    matrix = np.array([[meal.get(field, 0) for field in NUTRIENTS] for meal in meals], dtype=float)
+    return {
+        field: int(total) if total.is_integer() else total
+        for field, total in zip(NUTRIENTS, matrix.sum(axis=0).tolist())
+    }
+
+
+def json_number(value: float) -> Any:
+    """Turn a float total into an int when integral, else round off accumulation noise"""
+    return int(value) if value.is_integer() else round(value, 2)
+
+
+def macro_percentages(totals: np.ndarray) -> List[Dict[str, float]]:
+    """Get the share of calories from each macro for an (n, 4) array of nutrient totals"""
+    totals = np.asarray(totals, dtype=float).reshape(-1, len(NUTRIENTS))
+    calories = totals[:, NUTRIENTS.index("calories")]
+    safe_calories = np.where(calories > 0, calories, 1.0)
+    shares = {
+        field: np.where(calories > 0, totals[:, NUTRIENTS.index(field)] * kcal / safe_calories * 100, 0.0).tolist()
+        for field, kcal in MACRO_KCAL.items()
+    }
+    return [{field: round(shares[field][i], 1) for field in MACRO_KCAL} for i in range(len(totals))]
+
+
+class MealStore:
+    """Columnar view of the catalog: one array per nutrient field, addressed by meal ID
+
+    Rows are kept sorted by meal ID, so any array of IDs maps to rows with a single
+    searchsorted and totals are fancy indexing plus sum(axis=...). Each row remembers
+    its category and position, so the catalog records stay the adapter for JSON output.
+    """
+
+    def __init__(self, meal_database: Dict[str, CatalogCategory]):
+        categories = list(meal_database.values())
+        ids = np.concatenate([category.column("id") for category in categories])
+        order = np.argsort(ids, kind="stable")
+        self.ids = ids[order]
+        if len(np.unique(self.ids)) != len(self.ids):
+            raise ValueError("Meal IDs must be unique across the catalog")
+
+        # Integer fields stay integer so totals serialise exactly as the catalog values do
+        self.columns = {
+            field: np.concatenate([category.column(field) for category in categories])[order]
+            for field in NUTRIENTS
+        }
+        self.category_ids = {meal_type: np.sort(category.column("id")) for meal_type, category in meal_database.items()}
+        self._categories = categories
+        self._category_of = np.concatenate([np.full(len(category), i) for i, category in enumerate(categories)])[order]
+        self._position_of = np.concatenate([np.arange(len(category)) for category in categories])[order]
+
+    def __contains__(self, meal_id: int) -> bool:
+        row = int(np.searchsorted(self.ids, meal_id))
+        return row < len(self.ids) and self.ids[row] == meal_id
+
+    def rows(self, ids: Any) -> np.ndarray:
+        """Map an array of meal IDs (any shape) to store rows, rejecting unknown IDs"""
+        ids = np.asarray(ids, dtype=np.int64)
+        rows = np.minimum(np.searchsorted(self.ids, ids), max(len(self.ids) - 1, 0))
+        if len(self.ids) == 0 or not np.array_equal(self.ids[rows], ids):
+            unknown = sorted(set(ids.ravel().tolist()) - set(self.ids.tolist()))
+            raise KeyError(f"Unknown meal IDs: {unknown}")
+        return rows
+
+    def locate(self, meal_id: int) -> Tuple[str, int]:
+        """Get the category name and position within it of a meal by ID"""
+        row = int(self.rows(meal_id))
+        return self._categories[self._category_of[row]].name, int(self._position_of[row])
+
+    def meal(self, meal_id: int) -> Dict[str, Any]:
+        """Get the dict view of a meal by ID"""
+        row = int(self.rows(meal_id))
+        return self._categories[self._category_of[row]][int(self._position_of[row])]
+
+    def records(self, ids: Any) -> List[bytes]:
+        """Get the compiled JSON records of meals by ID, without decoding them"""
+        rows = self.rows(ids)
+        return [
+            self._categories[category].record(position)
+            for category, position in zip(self._category_of[rows].tolist(), self._position_of[rows].tolist())
+        ]
+
+    def nutrient_matrix(self, ids: Any) -> np.ndarray:
+        """Get the (..., 4) float nutrient array for an array of meal IDs"""
+        rows = self.rows(ids)
+        return np.stack([self.columns[field][rows] for field in NUTRIENTS], axis=-1).astype(float)
+
+    def totals(self, ids: Any, axis: Any = None) -> Dict[str, np.ndarray]:
+        """Sum each nutrient column over an array of meal IDs along the given axis"""
+        rows = self.rows(ids)
+        return {field: self.columns[field][rows].sum(axis=axis) for field in NUTRIENTS}
+
+    def set_totals(self, ids: Any, portions: Any, set_index: Any, set_count: int) -> np.ndarray:
+        """Total portion-weighted nutrients per meal-set in one pass
+
+        `ids`, `portions` and `set_index` are flat parallel arrays; row i of the result
+        holds the (calories, protein, carbs, fats) totals of the entries with set_index i.
+        """
+        rows = self.rows(ids)
+        portions = np.asarray(portions, dtype=float)
+        set_index = np.asarray(set_index, dtype=np.int64)
+        return np.stack([
+            np.bincount(set_index, weights=self.columns[field][rows] * portions, minlength=set_count)
+            for field in NUTRIENTS
+        ], axis=-1)
@@ -0,0 +1,268 @@
+"""
+Dietary Swap Engine
+Derives substituted variants of catalog meals (e.g. vegan, dairy-free) with recomputed macros and tags
+
+Variants are generated once, when the meal catalog is compiled, so restricted users get a
+larger candidate pool with no per-request substitution cost.
+"""
+
+import re
+from functools import lru_cache
+from itertools import combinations
+from typing import Dict, List, Any, Optional, Tuple
+
+# Ingredient substitutions: keyword -> (replacement, per-serving macro change as
+# (protein, carbs, fats) grams), plus words that mean the ingredient is already swapped
+DIETARY_SWAPS = {
+    "milk": {"replacement": "almond milk", "delta": (-3, -5, -2), "unless": ["almond", "coconut", "soy", "oat"]},
+    "chicken": {"replacement": "tofu", "delta": (-20, 4, 8), "unless": []},
+    "bread": {"replacement": "gluten-free bread", "delta": (-6, 6, 2), "unless": ["gluten-free"]},
+    "pasta": {"replacement": "chickpea pasta", "delta": (9, -13, 3), "unless": ["chickpea"]},
+    "rice": {"replacement": "cauliflower rice", "delta": (-3, -40, -2), "unless": ["cauliflower"]},
+    "butter": {"replacement": "coconut oil", "delta": (0, 0, 3), "unless": ["almond", "peanut", "nut"]},
+    "eggs": {"replacement": "flax eggs", "delta": (-9, 3, -4), "unless": ["flax"]},
+    "cheese": {"replacement": "nutritional yeast", "delta": (1, 5, -10), "unless": []},
+}
+
+# Calories per gram of (protein, carbs, fats), which turn a swap's macro change into calories
+KCAL_PER_GRAM = (4, 4, 9)
+
+# How each swap rewrites meal names: (phrase, replacement) pairs tried in order, so a
+# variant's name stops mentioning what it swapped out. A phrase right after one of the
+# swap's "unless" words (e.g. "Almond Butter") is left alone.
+NAME_SWAPS = {
+    "milk": [("milk", "Almond Milk")],
+    "chicken": [("chicken", "Tofu")],
+    "bread": [("whole (?:wheat|grain) toast", "Gluten-Free Toast"), ("(?:whole (?:wheat|grain) )?bread", "Gluten-Free Bread")],
+    "pasta": [("(?:whole wheat )?pasta", "Chickpea Pasta")],
+    "rice": [("(?:brown |white )?rice", "Cauliflower Rice")],
+    "butter": [("butter", "Coconut Oil")],
+    "eggs": [("eggs", "Flax Eggs"), ("egg", "Flax Egg")],
+    "cheese": [("cheese", "Nutritional Yeast")],
+}
+
+# Keywords that rule an ingredient out of each diet
+ANIMAL_KEYWORDS = ["chicken", "beef", "turkey", "fish", "salmon", "tuna", "shrimp", "egg", "milk", "butter", "cheese", "yogurt", "whey"]
+DAIRY_KEYWORDS = ["milk", "butter", "cheese", "yogurt", "whey", "cream"]
+GLUTEN_KEYWORDS = ["bread", "pasta", "wheat", "granola", "soy sauce", "couscous", "barley"]
+
+# Qualifiers that mark an ingredient as the plant-based or gluten-free form of a keyword
+PLANT_QUALIFIERS = ["almond", "coconut", "soy", "oat", "peanut", "cashew", "flax", "vegan"]
+GLUTEN_FREE_QUALIFIERS = ["gluten-free", "chickpea", "rice", "lentil"]
+
+# Swap profiles: which swaps each one applies, the tag a valid variant earns and its name suffix
+SWAP_PROFILES = {
+    "vegan": {"swaps": ["milk", "chicken", "butter", "eggs", "cheese"], "tag": "vegan_friendly", "label": "Vegan"},
+    "dairy_free": {"swaps": ["milk", "butter", "cheese"], "tag": "dairy_free", "label": "Dairy-Free"},
+    "gluten_free": {"swaps": ["bread", "pasta"], "tag": "gluten_free", "label": "Gluten-Free"},
+    "keto": {"swaps": ["rice"], "tag": "keto_friendly", "label": "Keto"},
+}
+
+# Dietary restrictions (as sent by the app) that unlock each swap profile
+RESTRICTION_SWAP_PROFILES = {
+    "Vegan": "vegan",
+    "Dairy-Free": "dairy_free",
+    "Gluten-Free": "gluten_free",
+    "Keto": "keto",
+}
+
+# Every variant carries this tag, plus swap:<profile> for each profile applied to it
+VARIANT_TAG = "swap_variant"
+
+# Inherited tags that rest on one macro, as (macro, direction, tolerance): a variant loses
+# the tag once its swaps move that macro up (1) or down (-1) by more than the tolerance,
+# a share of the original meal's amount
+MACRO_TAGS = {
+    "high_protein": ("protein", -1, 0.10),
+    "low_carb": ("carbs", 1, 0.0),
+    "keto_friendly": ("carbs", 1, 0.0),
+    "diabetes_friendly": ("carbs", 1, 0.0),
+    "low_calorie": ("calories", 1, 0.0),
+    "low_fat": ("fats", 1, 0.0),
+}
+
+# Variant IDs are VARIANT_ID_BASE * (bitmask of applied profiles) + original ID, so they stay stable
+VARIANT_ID_BASE = 1_000_000
+
+# Keto variants only earn keto_friendly at or below this many grams of carbs
+KETO_CARB_LIMIT = 20
+
+# Positions in the flags from _ingredient_flags
+ANIMAL, DAIRY, GLUTEN = range(3)
+
+_PROFILE_BITS = {profile: 1 << bit for bit, profile in enumerate(SWAP_PROFILES)}
+
+
+def _keyword_pattern(keywords: List[str]) -> "re.Pattern":
+    return re.compile(r"\b(?:" + "|".join(re.escape(keyword) for keyword in keywords) + r")s?\b")
+
+
+_ANIMAL_PATTERN = _keyword_pattern(ANIMAL_KEYWORDS)
+_DAIRY_PATTERN = _keyword_pattern(DAIRY_KEYWORDS)
+_GLUTEN_PATTERN = _keyword_pattern(GLUTEN_KEYWORDS)
+_SWAP_PATTERNS = {keyword: _keyword_pattern([keyword.rstrip("s")]) for keyword in DIETARY_SWAPS}
+_NAME_PATTERNS = {
+    keyword: [(re.compile(rf"\b{phrase}\b", re.IGNORECASE), replacement) for phrase, replacement in renames]
+    for keyword, renames in NAME_SWAPS.items()
+}
+
+
+@lru_cache(maxsize=4096)
+def _ingredient_swaps(ingredient: str) -> Tuple[str, ...]:
+    """Get every swap keyword that applies to an ingredient, in swap table order"""
+    lowered = ingredient.lower()
+    return tuple(
+        keyword for keyword, rule in DIETARY_SWAPS.items()
+        if _SWAP_PATTERNS[keyword].search(lowered) and not any(word in lowered for word in rule["unless"])
+    )
+
+
+@lru_cache(maxsize=4096)
+def _ingredient_flags(ingredient: str) -> Tuple[bool, bool, bool]:
+    """Get whether an ingredient is (animal-derived, dairy, gluten-containing)"""
+    lowered = ingredient.lower()
+    plant = any(qualifier in lowered for qualifier in PLANT_QUALIFIERS)
+    return (
+        bool(_ANIMAL_PATTERN.search(lowered)) and not plant,
+        bool(_DAIRY_PATTERN.search(lowered)) and not plant,
+        bool(_GLUTEN_PATTERN.search(lowered)) and not any(q in lowered for q in GLUTEN_FREE_QUALIFIERS),
+    )
+
+
+def _contains(ingredients: List[str], flag: int) -> bool:
+    """Check whether any ingredient has one of the (animal, dairy, gluten) flags"""
+    return any(_ingredient_flags(ingredient)[flag] for ingredient in ingredients)
+
+
+def profile_tag(profile: str) -> str:
+    """Get the tag marking variants that applied a swap profile"""
+    return f"swap:{profile}"
+
+
+def _swap_ingredient(ingredient: str, swaps: List[str]) -> Optional[Tuple[str, str]]:
+    """Find the first applicable swap for an ingredient, as (swap keyword, replacement)"""
+    for keyword in _ingredient_swaps(ingredient):
+        if keyword in swaps:
+            return keyword, DIETARY_SWAPS[keyword]["replacement"]
+    return None
+
+
+def _swap_name(name: str, keyword: str) -> str:
+    """Rewrite the phrases of a meal name that a swap replaced"""
+    unless = DIETARY_SWAPS[keyword]["unless"]
+
+    def rename(match: "re.Match", replacement: str) -> str:
+        preceding = match.string[:match.start()].split()
+        return match.group(0) if preceding and preceding[-1].lower() in unless else replacement
+
+    for pattern, replacement in _NAME_PATTERNS[keyword]:
+        renamed = pattern.sub(lambda match: rename(match, replacement), name)
+        if renamed != name:
+            return renamed
+    return name
+
+
+def derived_tags(ingredients: List[str]) -> List[str]:
+    """Get the tags that follow from a meal's ingredients alone"""
+    tags = []
+    if not _contains(ingredients, DAIRY):
+        tags.append("dairy_free")
+    if not _contains(ingredients, GLUTEN):
+        tags.append("gluten_free")
+    return tags
+
+
+def _apply_profiles(meal: Dict[str, Any], profiles: Tuple[str, ...]) -> Optional[Dict[str, Any]]:
+    """Build the variant of a meal with the swaps of several profiles, or None if it is not worth offering"""
+    swaps = [keyword for keyword in DIETARY_SWAPS if any(keyword in SWAP_PROFILES[p]["swaps"] for p in profiles)]
+    ingredients = []
+    applied = []
+    for ingredient in meal["ingredients"]:
+        swap = _swap_ingredient(ingredient, swaps)
+        if swap is None:
+            ingredients.append(ingredient)
+        else:
+            ingredients.append(swap[1])
+            applied.append({"from": ingredient, "to": swap[1], "swap": swap[0]})
+
+    # Only keep variants where every profile contributed a swap, so each one is distinct
+    used = {entry["swap"] for entry in applied}
+    if not all(used & set(SWAP_PROFILES[p]["swaps"]) for p in profiles):
+        return None
+
+    changes = [sum(DIETARY_SWAPS[entry["swap"]]["delta"][axis] for entry in applied) for axis in range(3)]
+    protein, carbs, fats = (meal["protein"] + changes[0], meal["carbs"] + changes[1], meal["fats"] + changes[2])
+    # A swap that would take more of a macro than the meal has does not describe this meal
+    if min(protein, carbs, fats) < 0:
+        return None
+    # Calories follow the macros, so the variant keeps whatever the original's label adds beyond 4/4/9
+    calories = meal["calories"] + sum(change * kcal for change, kcal in zip(changes, KCAL_PER_GRAM))
+
+    # A variant must earn the tag of every profile it applies, or no user could be offered it
+    earned = {
+        "vegan": "vegan_friendly" in meal["suitableFor"] or not _contains(ingredients, ANIMAL),
+        "dairy_free": not _contains(ingredients, DAIRY),
+        "gluten_free": not _contains(ingredients, GLUTEN),
+        "keto": carbs <= KETO_CARB_LIMIT,
+    }
+    if not all(earned[profile] for profile in profiles):
+        return None
+
+    macros = {"calories": calories, "protein": protein, "carbs": carbs, "fats": fats}
+    dropped = {"dairy_free", "gluten_free"} | {
+        tag for tag, (field, direction, tolerance) in MACRO_TAGS.items()
+        if (macros[field] - meal[field]) * direction > tolerance * meal[field]
+    }
+    tags = [tag for tag in meal["suitableFor"] if tag not in dropped]
+    tags += [SWAP_PROFILES[p]["tag"] for p in profiles if SWAP_PROFILES[p]["tag"] not in tags]
+    tags += [tag for tag in derived_tags(ingredients) if tag not in tags]
+    tags += [VARIANT_TAG] + [profile_tag(profile) for profile in profiles]
+
+    name = meal["name"]
+    for keyword in dict.fromkeys(entry["swap"] for entry in applied):
+        name = _swap_name(name, keyword)
+    labels = ", ".join(SWAP_PROFILES[profile]["label"] for profile in profiles)
+    profile_bits = sum(_PROFILE_BITS[profile] for profile in profiles)
+    return {
+        **meal,
+        "id": VARIANT_ID_BASE * profile_bits + meal["id"],
+        "name": f"{name} ({labels})",
+        "calories": calories,
+        "protein": protein,
+        "carbs": carbs,
+        "fats": fats,
+        "ingredients": ingredients,
+        "suitableFor": tags,
+        "variantOf": meal["id"],
+        "swaps": [{"from": entry["from"], "to": entry["to"]} for entry in applied],
+    }
+
+
+def expand_meal_catalog(catalog: Dict[str, List[Dict[str, Any]]]) -> Dict[str, List[Dict[str, Any]]]:
+    """Add derived tags to every meal and append its swapped variants to the same category"""
+    expanded = {}
+    for meal_type, meals in catalog.items():
+        originals = []
+        variants = []
+        for meal in meals:
+            if not 0 <= meal["id"] < VARIANT_ID_BASE:
+                raise ValueError(f"Meal IDs must be between 0 and {VARIANT_ID_BASE - 1}: {meal['name']}")
+            original = {
+                **meal,
+                "suitableFor": meal["suitableFor"] + [t for t in derived_tags(meal["ingredients"]) if t not in meal["suitableFor"]]
+            }
+            originals.append(original)
+
+            # Only profiles with a swap for one of this meal's ingredients can yield a variant
+            matched = {keyword for ingredient in meal["ingredients"] for keyword in _ingredient_swaps(ingredient)}
+            applicable = [p for p in SWAP_PROFILES if matched.intersection(SWAP_PROFILES[p]["swaps"])]
+
+            seen = {tuple(meal["ingredients"])}
+            for size in range(1, len(applicable) + 1):
+                for profiles in combinations(applicable, size):
+                    variant = _apply_profiles(meal, profiles)
+                    if variant is not None and tuple(variant["ingredients"]) not in seen:
+                        seen.add(tuple(variant["ingredients"]))
+                        variants.append(variant)
+        expanded[meal_type] = originals + variants
+    return expanded
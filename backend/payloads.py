@@ -0,0 +1,69 @@
+"""
+Pre-encoded JSON Payloads
+Encodes constant response sections once so requests only serialise what actually varies
+
+Fragments are encoded the way Flask's jsonify does (sorted keys, compact separators,
+ASCII escapes). Meal records spliced in straight from the compiled catalog keep their
+source key order and UTF-8 text, so a plan body decodes to the same JSON jsonify would
+have produced without being byte-for-byte identical to it.
+"""
+
+import hashlib
+import json
+from functools import lru_cache
+from typing import Any, Dict, List
+
+
+def encode_json(value: Any) -> bytes:
+    """Encode a value as a JSON fragment"""
+    return json.dumps(value, sort_keys=True, separators=(",", ":")).encode("ascii")
+
+
+@lru_cache(maxsize=1024)
+def _encoded_key(key: str) -> bytes:
+    """Encode an object key with its trailing colon"""
+    return encode_json(key) + b":"
+
+
+def splice_object(fields: Dict[str, bytes]) -> bytes:
+    """Join already-encoded field values into a JSON object, keys sorted like encode_json"""
+    return b"{" + b",".join(_encoded_key(key) + fields[key] for key in sorted(fields)) + b"}"
+
+
+def etag_for(body: bytes) -> str:
+    """Get a short content hash to use as an entity tag"""
+    return hashlib.blake2b(body, digest_size=12).hexdigest()
+
+
+class PlanPayload:
+    """A generated meal plan held as encoded JSON, ready to be served many times
+
+    Only the fields that change per request (the timestamp, the echoed dietary
+    restrictions and the day dates) are encoded when it is rendered. Everything else,
+    meals included, was encoded once when the plan was built.
+    """
+
+    # Plan fields supplied at render time rather than stored
+    REQUEST_FIELDS = ("generatedAt", "dietaryNotes", "days")
+
+    def __init__(self, fields: Dict[str, bytes], days: List[bytes]):
+        """fields maps the stored plan fields to encoded values; days holds each day's encoded object minus its date"""
+        self.fields = fields
+        self.days = days
+
+    def __len__(self) -> int:
+        return len(self.days)
+
+    def render(self, generated_at: str, dietary_notes: Any, dates: List[str]) -> bytes:
+        """Encode the whole plan with this request's timestamp, restrictions and day dates"""
+        # "date" sorts before every other day field, so it is simply prepended
+        days = {
+            f"day_{day + 1}": b'{"date":' + encode_json(date) + b"," + encoded[1:]
+            for day, (date, encoded) in enumerate(zip(dates, self.days))
+        }
+        return splice_object({
+            **self.fields,
+            "generatedAt": encode_json(generated_at),
+            "dietaryNotes": encode_json(dietary_notes),
+            "days": splice_object(days)
+        })
@@ -3,189 +3,173 @@ AI-Powered Personalized Workout Plan Generator
 Generates workout plans based on user profile, goals, and fitness level
 """
 
+import copy
 import json
-from typing import Dict, List, Any
+import os
+import re
+from functools import cached_property
+from typing import Dict, List, Any, Iterator, Optional, Tuple
 from datetime import datetime, timedelta
+from catalog import DATA_DIR, CatalogCategory, CatalogRecord, load_catalog, thaw
+from meal_index import iter_positions
+from payloads import encode_json, splice_object
+
+EXERCISE_CATALOG_PATH = os.path.join(DATA_DIR, "exercises.json")
+
+# Profile fields a workout plan request must include
+WORKOUT_REQUIRED_FIELDS = ['goal', 'fitnessExperience']
+
+# Catalog fields that prescribe a dose; a template's own prescription replaces them
+PRESCRIPTION_FIELDS = ('sets', 'reps', 'duration', 'intensity')
+
+# Training advice for each medical condition, in the order it is given
+CONDITION_ADVICE = {
+    'lower_back_pain': "Avoid heavy deadlifts and loaded spinal flexion. Focus on core strengthening. Consult a physical therapist.",
+    'knee_problems': "Modify squats to partial range of motion. Avoid deep lunges. Consider cycling over running.",
+    'shoulder_injury': "Avoid heavy pressing movements. Focus on rotator cuff exercises. Use machines over free weights.",
+    'diabetes': "Stay well-hydrated, monitor energy levels, carry fast-acting carbs during training.",
+    'hypertension': "Avoid isometric holds, focus on moderate intensity, include more cardio.",
+}
+
+# Plan fields that echo the request rather than depend on the cache key; set per response
+WORKOUT_REQUEST_FIELDS = ('fitnessLevel', 'generatedAt')
+
+# Weeks in one periodized program cycle; longer programs repeat the cycle
+PROGRAM_WEEKS = 8
+
+# Longest program window a plan may expand
+MAX_PROGRAM_WEEKS = 52
+
+# The cycle's two-week phases, as (progressionStrategy key, focus, per-week rules). Each
+# week's rules give the reps added, the share of the usual volume and the sets added.
+PROGRESSION_PHASES = [
+    ("week1to2", "Focus on form and establishing baseline", [
+        {"extraReps": 0, "volume": 1.0, "extraSets": 0},
+        {"extraReps": 0, "volume": 1.0, "extraSets": 0},
+    ]),
+    ("week3to4", "Increase weight by 5-10% or add 1-2 reps", [
+        {"extraReps": 1, "volume": 1.0, "extraSets": 0},
+        {"extraReps": 2, "volume": 1.0, "extraSets": 0},
+    ]),
+    ("week5to6", "Deload week - reduce volume by 40%, maintain intensity", [
+        {"extraReps": 0, "volume": 0.6, "extraSets": 0},
+        {"extraReps": 0, "volume": 0.6, "extraSets": 0},
+    ]),
+    ("week7to8", "Final push - attempt new PRs or add extra volume", [
+        {"extraReps": 0, "volume": 1.0, "extraSets": 1},
+        {"extraReps": 0, "volume": 1.0, "extraSets": 1},
+    ]),
+]
+
+# A rep prescription such as "8" or "8-10"
+_REPS_PATTERN = re.compile(r"^(\d+)(?:-(\d+))?$")
 
 class WorkoutAIGenerator:
     """Generates AI-powered personalized workout plans"""
     
-    def __init__(self):
-        self.exercise_database = self._initialize_exercise_database()
+    def __init__(self, catalog_path: str = EXERCISE_CATALOG_PATH):
+        self.catalog_path = catalog_path
         self.workout_templates = self._initialize_workout_templates()
     
-    def _initialize_exercise_database(self) -> Dict[str, List[Dict[str, Any]]]:
-        """Initialize comprehensive exercise database"""
+    @cached_property
+    def exercise_database(self) -> Dict[str, CatalogCategory]:
+        """Exercise catalog by category, opened on first use so importing the module stays cheap"""
+        return self._initialize_exercise_database()
+    
+    @cached_property
+    def exercise_index(self) -> Dict[str, CatalogRecord]:
+        """Exercises by case-folded name; a name listed in several categories maps to its first entry"""
+        index = {}
+        for exercises in self.exercise_database.values():
+            for exercise in exercises:
+                index.setdefault(exercise.get('name', '').casefold(), exercise)
+        return index
+    
+    @cached_property
+    def exercise_by_id(self) -> Dict[int, CatalogRecord]:
+        """Exercises by their stable catalog ID, which is how plans refer to them"""
+        return {exercise['id']: exercise for exercises in self.exercise_database.values() for exercise in exercises}
+    
+    @cached_property
+    def template_exercise_ids(self) -> Dict[str, int]:
+        """Catalog ID of every exercise the templates name, resolved by name once; unknown names are left out"""
+        resolved = {}
+        for template in self.workout_templates.values():
+            for day_data in template.get('days', {}).values():
+                for exercise in day_data.get('exercises', []):
+                    found = self.find_exercise(exercise['name'])
+                    if found is not None:
+                        resolved[exercise['name']] = found['id']
+        return resolved
+    
+    @cached_property
+    def weekly_schedules(self) -> Dict[str, Dict[str, Any]]:
+        """Every template's weekly schedule, joined against the exercise catalog once
+        
+        Plans share these schedules, so they must not be modified.
+        """
         return {
-            "strength": [
-                {
-                    "name": "Bench Press",
-                    "muscle_groups": ["chest", "triceps", "shoulders"],
-                    "difficulty": "intermediate",
-                    "sets": 4,
-                    "reps": "6-8",
-                    "rest": "3 mins",
-                    "equipment": "barbell",
-                    "instructions": "Lie flat on bench, lower bar to chest, press up explosively",
-                    "alternatives": ["Dumbbell Press", "Machine Chest Press"]
-                },
-                {
-                    "name": "Squats",
-                    "muscle_groups": ["quads", "glutes", "hamstrings"],
-                    "difficulty": "intermediate",
-                    "sets": 4,
-                    "reps": "6-8",
-                    "rest": "3 mins",
-                    "equipment": "barbell",
-                    "instructions": "Feet shoulder-width apart, lower hips back and down, drive through heels",
-                    "alternatives": ["Leg Press", "Goblet Squats"]
-                },
-                {
-                    "name": "Deadlifts",
-                    "muscle_groups": ["back", "glutes", "hamstrings", "quads"],
-                    "difficulty": "advanced",
-                    "sets": 3,
-                    "reps": "5-6",
-                    "rest": "3 mins",
-                    "equipment": "barbell",
-                    "instructions": "Feet hip-width apart, grip shoulder-width, lift from hips then knees",
-                    "alternatives": ["Romanian Deadlifts", "Trap Bar Deadlifts"]
-                },
-                {
-                    "name": "Barbell Rows",
-                    "muscle_groups": ["back", "biceps", "traps"],
-                    "difficulty": "intermediate",
-                    "sets": 4,
-                    "reps": "6-8",
-                    "rest": "2 mins",
-                    "equipment": "barbell",
-                    "instructions": "Hinge at hips, pull bar to lower chest, control descent",
-                    "alternatives": ["Dumbbell Rows", "Machine Rows"]
-                },
-                {
-                    "name": "Overhead Press",
-                    "muscle_groups": ["shoulders", "triceps", "chest"],
-                    "difficulty": "intermediate",
-                    "sets": 3,
-                    "reps": "6-8",
-                    "rest": "2 mins",
-                    "equipment": "barbell",
-                    "instructions": "Press from shoulders to full extension overhead",
-                    "alternatives": ["Dumbbell Press", "Machine Press"]
-                },
-                {
-                    "name": "Pull-ups",
-                    "muscle_groups": ["back", "biceps", "lats"],
-                    "difficulty": "intermediate",
-                    "sets": 3,
-                    "reps": "8-12",
-                    "rest": "2 mins",
-                    "equipment": "pull-up bar",
-                    "instructions": "Grip bar slightly wider than shoulder-width, pull until chin over bar",
-                    "alternatives": ["Assisted Pull-ups", "Lat Pulldown"]
-                },
-            ],
-            "cardio": [
-                {
-                    "name": "Running",
-                    "intensity": "variable",
-                    "duration": "20-45 mins",
-                    "caloriesBurn": 400,
-                    "equipment": "none",
-                    "instructions": "Maintain steady pace, breathe rhythmically",
-                    "variations": ["HIIT", "Steady State", "Hill Sprints"]
-                },
-                {
-                    "name": "Rowing Machine",
-                    "intensity": "high",
-                    "duration": "20-30 mins",
-                    "caloriesBurn": 350,
-                    "equipment": "rower",
-                    "instructions": "Drive through legs first, then lean back, pull arms",
-                    "variations": ["Steady Pace", "Interval Training"]
-                },
-                {
-                    "name": "Cycling",
-                    "intensity": "variable",
-                    "duration": "30-60 mins",
-                    "caloriesBurn": 350,
-                    "equipment": "bike",
-                    "instructions": "Maintain cadence of 80-100 RPM, adjust resistance as needed",
-                    "variations": ["Steady State", "Sprints", "Climb Intervals"]
-                },
-                {
-                    "name": "Jump Rope",
-                    "intensity": "high",
-                    "duration": "15-20 mins",
-                    "caloriesBurn": 280,
-                    "equipment": "jump rope",
-                    "instructions": "Keep hands at waist height, jump on balls of feet",
-                    "variations": ["Single Leg", "Double Unders", "High Knees"]
-                },
-                {
-                    "name": "Elliptical",
-                    "intensity": "moderate",
-                    "duration": "25-40 mins",
-                    "caloriesBurn": 300,
-                    "equipment": "elliptical",
-                    "instructions": "Maintain steady pace, use full range of motion",
-                    "variations": ["Steady State", "Hill Climb", "Intervals"]
-                },
-            ],
-            "flexibility": [
-                {
-                    "name": "Yoga",
-                    "type": "full-body",
-                    "duration": "30-60 mins",
-                    "intensity": "low",
-                    "benefits": ["flexibility", "balance", "mental_clarity"],
-                    "instructions": "Follow instructor or flow, breathe deeply",
-                },
-                {
-                    "name": "Dynamic Stretching",
-                    "type": "mobility",
-                    "duration": "10-15 mins",
-                    "intensity": "low",
-                    "benefits": ["flexibility", "mobility", "activation"],
-                    "instructions": "Perform controlled movements through full range of motion",
-                },
-                {
-                    "name": "Foam Rolling",
-                    "type": "recovery",
-                    "duration": "10-20 mins",
-                    "intensity": "low",
-                    "benefits": ["recovery", "flexibility", "soreness_relief"],
-                    "instructions": "Roll slowly along muscle groups, focus on tight areas",
-                },
-            ],
-            "core": [
-                {
-                    "name": "Planks",
-                    "sets": 3,
-                    "duration": "30-60 seconds",
-                    "rest": "60 seconds",
-                    "difficulty": "beginner",
-                    "instructions": "Keep body straight line, engage core, breathe steadily",
-                },
-                {
-                    "name": "Ab Wheel Rollouts",
-                    "sets": 3,
-                    "reps": "8-12",
-                    "rest": "90 seconds",
-                    "difficulty": "advanced",
-                    "instructions": "Roll forward slowly, engage core, return to start",
-                },
-                {
-                    "name": "Hollow Body Holds",
-                    "sets": 3,
-                    "duration": "20-40 seconds",
-                    "rest": "60 seconds",
-                    "difficulty": "intermediate",
-                    "instructions": "Tuck chin, squeeze glutes, create hollow body position",
-                },
-            ]
+            template_key: self._materialize_schedule(template)
+            for template_key, template in self.workout_templates.items()
+        }
+    
+    @cached_property
+    def contraindication_masks(self) -> Dict[str, int]:
+        """Bitset over exercise IDs of the exercises each medical condition rules out
+        
+        Built from the catalog's compiled contraindication tags, so excluding every
+        exercise a set of conditions rules out is one OR per condition.
+        """
+        masks = {}
+        for category in self.exercise_database.values():
+            ids = category.column('id')
+            for condition, positions in category.tag_masks().items():
+                for position in iter_positions(positions):
+                    masks[condition] = masks.get(condition, 0) | 1 << int(ids[position])
+        return masks
+    
+    @cached_property
+    def exercise_alternatives(self) -> Dict[int, List[CatalogRecord]]:
+        """Each exercise's alternatives that are in the catalog, by exercise ID, in preference order
+        
+        Alternatives outside the catalog are left out: with no contraindications on
+        record they cannot be offered as safe substitutes.
+        """
+        alternatives = {}
+        for exercises in self.exercise_database.values():
+            for exercise in exercises:
+                found = [self.find_exercise(name) for name in exercise.get('alternatives', [])]
+                alternatives[exercise['id']] = [alternative for alternative in found if alternative is not None]
+        return alternatives
+    
+    @cached_property
+    def template_masks(self) -> Dict[str, int]:
+        """Bitset over exercise IDs of the exercises in each template's weekly schedule"""
+        return {
+            template_key: self._exercise_mask(
+                exercise for day_data in schedule.values() for exercise in day_data["exercises"]
+            )
+            for template_key, schedule in self.weekly_schedules.items()
         }
     
+    def missing_template_exercises(self) -> Dict[str, List[str]]:
+        """Get the exercises each template names that the exercise catalog does not have"""
+        missing = {}
+        for template_key, template in self.workout_templates.items():
+            names = [
+                exercise['name']
+                for day_data in template.get('days', {}).values()
+                for exercise in day_data.get('exercises', [])
+                if exercise['name'] not in self.template_exercise_ids
+            ]
+            if names:
+                missing[template_key] = list(dict.fromkeys(names))
+        return missing
+    
+    def _initialize_exercise_database(self) -> Dict[str, CatalogCategory]:
+        """Open the compiled exercise catalog"""
+        return load_catalog(self.catalog_path).categories
+    
     def _initialize_workout_templates(self) -> Dict[str, Dict[str, Any]]:
         """Initialize workout templates for different fitness levels and goals"""
         return {
@@ -291,8 +275,115 @@ class WorkoutAIGenerator:
             },
         }
     
-    def generate_workout_plan(self, user_profile: Dict[str, Any], days: int = 7) -> Dict[str, Any]:
-        """Generate personalized workout plan"""
+    def generate_workout_plan(
+        self,
+        user_profile: Dict[str, Any],
+        days: int = 7,
+        start_week: int = 1,
+        weeks: int = PROGRAM_WEEKS
+    ) -> Dict[str, Any]:
+        """Generate personalized workout plan, with the program expanded for a window of weeks
+        
+        The plan is the caller's own copy, so it can be modified freely.
+        """
+        return copy.deepcopy(self._build_workout_plan(user_profile, start_week, weeks))
+    
+    def _build_workout_plan(self, user_profile: Dict[str, Any], start_week: int, weeks: int) -> Dict[str, Any]:
+        """Build a workout plan that shares the cached schedules and cycles, for encoding only"""
+        conditions = self._normalize_conditions(user_profile.get('medicalConditions', []))
+        workout_plan = self._plan_header(user_profile, start_week, weeks)
+        workout_plan["program"] = list(self.iter_program_weeks(workout_plan["template"], start_week, weeks, conditions))
+        return workout_plan
+    
+    def iter_workout_plan(
+        self,
+        user_profile: Dict[str, Any],
+        start_week: int = 1,
+        weeks: int = PROGRAM_WEEKS
+    ) -> Iterator[Dict[str, Any]]:
+        """Generate a workout plan as a stream of records: a "plan" header, then one "week" record per week
+        
+        Each record is the caller's own copy, so it can be modified freely.
+        """
+        conditions = self._normalize_conditions(user_profile.get('medicalConditions', []))
+        header = self._plan_header(user_profile, start_week, weeks)
+        yield copy.deepcopy({"record": "plan", **header})
+        for week in self.iter_program_weeks(header["template"], start_week, weeks, conditions):
+            yield copy.deepcopy({"record": "week", **week})
+    
+    def iter_program_weeks(
+        self,
+        template_key: str,
+        start_week: int = 1,
+        weeks: int = PROGRAM_WEEKS,
+        conditions: tuple = ()
+    ) -> Iterator[Dict[str, Any]]:
+        """Yield the sessions of each program week in a window, one week at a time
+        
+        Weeks are built lazily from the template's progression cycle, so a window of any
+        length only ever holds one cycle of sessions. Conditions are normalised medical
+        conditions whose contraindicated exercises are left out of the sessions.
+        """
+        cycle = self.program_cycles.get(template_key, self.program_cycles['beginner_strength'])
+        if self.template_masks.get(template_key, 0) & self.excluded_exercises(conditions):
+            schedule, _ = self._adjust_schedule(self._generate_schedule(template_key), conditions)
+            cycle = self._program_cycle(schedule)
+        for week in range(start_week, start_week + weeks):
+            yield {
+                "week": week,
+                "cycle": (week - 1) // PROGRAM_WEEKS + 1,
+                **cycle[(week - 1) % PROGRAM_WEEKS]
+            }
+    
+    @cached_property
+    def program_cycles(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Every template's progression cycle: the phase and sessions of each of its weeks"""
+        return {
+            template_key: self._program_cycle(schedule)
+            for template_key, schedule in self.weekly_schedules.items()
+        }
+    
+    def _program_cycle(self, schedule: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Build the phase and sessions of each week of one progression cycle over a weekly schedule"""
+        return [
+            {"phase": phase, "focus": focus, "sessions": self._progress_schedule(schedule, rules)}
+            for phase, focus, phase_weeks in PROGRESSION_PHASES
+            for rules in phase_weeks
+        ]
+    
+    def _progress_schedule(self, schedule: Dict[str, Any], rules: Dict[str, Any]) -> Dict[str, Any]:
+        """Apply one week's progression rules to a weekly schedule"""
+        # Baseline weeks change nothing, so they share the schedule rather than copying it
+        if not rules["extraReps"] and not rules["extraSets"] and rules["volume"] == 1.0:
+            return schedule
+        return {
+            day_name: {
+                **day_data,
+                "exercises": [self._progress_exercise(exercise, rules) for exercise in day_data["exercises"]]
+            }
+            for day_name, day_data in schedule.items()
+        }
+    
+    def _progress_exercise(self, exercise: Dict[str, Any], rules: Dict[str, Any]) -> Dict[str, Any]:
+        """Apply one week's progression rules to an exercise prescription
+        
+        Volume scales the sets, or the duration of exercises prescribed by time alone.
+        """
+        progressed = dict(exercise)
+        if isinstance(exercise.get('sets'), int):
+            progressed['sets'] = max(1, round(exercise['sets'] * rules["volume"])) + rules["extraSets"]
+        elif isinstance(exercise.get('duration'), str) and rules["volume"] != 1.0:
+            progressed['duration'] = re.sub(
+                r"\d+", lambda match: str(max(1, round(int(match.group()) * rules["volume"]))), exercise['duration']
+            )
+        
+        match = _REPS_PATTERN.match(exercise.get('reps', '')) if isinstance(exercise.get('reps'), str) else None
+        if match and rules["extraReps"]:
+            progressed['reps'] = "-".join(str(int(reps) + rules["extraReps"]) for reps in match.groups() if reps)
+        return progressed
+    
+    def _plan_header(self, user_profile: Dict[str, Any], start_week: int, weeks: int) -> Dict[str, Any]:
+        """Build the plan-level fields shared by the full and streamed plans"""
         
         # Determine user fitness level
         fitness_level = self._assess_fitness_level(user_profile)
@@ -302,8 +393,13 @@ class WorkoutAIGenerator:
         template_key = self._select_template(fitness_level, goal)
         template = self.workout_templates.get(template_key, self.workout_templates['beginner_strength'])
         
-        # Generate weekly schedule
-        workout_schedule = self._generate_schedule(template, user_profile)
+        # Weekly schedules are materialised once per template; only a schedule holding
+        # exercises the user's conditions rule out is copied and adjusted
+        workout_schedule = self._generate_schedule(template_key)
+        conditions = self._normalize_conditions(user_profile.get('medicalConditions', []))
+        adjustments = []
+        if self.template_masks.get(template_key, 0) & self.excluded_exercises(conditions):
+            workout_schedule, adjustments = self._adjust_schedule(workout_schedule, conditions)
         
         # Generate recovery and nutrition tips
         recovery_tips = self._generate_recovery_tips(goal, fitness_level)
@@ -313,10 +409,12 @@ class WorkoutAIGenerator:
             "fitnessLevel": fitness_level,
             "goal": goal,
             "template": template_key,
-            "duration": "8 weeks",
-            "frequency": template.get('frequency') or 3,
+            "duration": f"{PROGRAM_WEEKS} weeks",
+            "frequency": min(template.get('frequency') or 3, len(workout_schedule)),
             "durationPerSession": template.get('duration_per_session'),
             "weeklySchedule": workout_schedule,
+            "exerciseAdjustments": adjustments,
+            "programWeeks": {"start": start_week, "count": weeks},
             "recoveryTips": recovery_tips,
             "warmUpCooldown": warm_up_cooldown,
             "progressionStrategy": self._generate_progression_strategy(goal),
@@ -346,8 +444,12 @@ class WorkoutAIGenerator:
         else:
             return goal_map.get(goal, 'intermediate_strength')
     
-    def _generate_schedule(self, template: Dict[str, Any], user_profile: Dict[str, Any]) -> Dict[str, Any]:
-        """Generate weekly workout schedule"""
+    def _generate_schedule(self, template_key: str) -> Dict[str, Any]:
+        """Get the weekly workout schedule of a template"""
+        return self.weekly_schedules.get(template_key, self.weekly_schedules['beginner_strength'])
+    
+    def _materialize_schedule(self, template: Dict[str, Any]) -> Dict[str, Any]:
+        """Build a template's weekly schedule with every exercise's catalog details"""
         days = template.get('days', {})
         
         schedule = {}
@@ -356,12 +458,102 @@ class WorkoutAIGenerator:
                 "name": day_data.get('name', day_name),
                 "type": day_data.get('type', 'mixed'),
                 "duration": day_data.get('duration', "60 mins"),
-                "exercises": day_data.get('exercises', []),
+                "exercises": [
+                    self._join_exercise(self._resolve_prescription(exercise))
+                    for exercise in day_data.get('exercises', [])
+                    if exercise['name'] in self.template_exercise_ids
+                ],
                 "notes": f"Focus on controlled movements. Rest 2-3 minutes between sets."
             }
         
         return schedule
     
+    def _resolve_prescription(self, prescription: Dict[str, Any]) -> Dict[str, Any]:
+        """Turn a template prescription that names its exercise into one that refers to it by catalog ID"""
+        details = {field: value for field, value in prescription.items() if field != 'name'}
+        return {"id": self.template_exercise_ids[prescription['name']], **details}
+    
+    def _join_exercise(self, prescription: Dict[str, Any]) -> Dict[str, Any]:
+        """Combine a template's exercise prescription with the catalog entry of the exercise it refers to"""
+        exercise = self.exercise_by_id[prescription['id']]
+        details = {field: value for field, value in thaw(exercise).items() if field not in PRESCRIPTION_FIELDS}
+        return {**details, **prescription}
+    
+    def _exercise_mask(self, exercises: Iterator[Dict[str, Any]]) -> int:
+        """Get the bitset over exercise IDs of scheduled exercises"""
+        mask = 0
+        for exercise in exercises:
+            mask |= 1 << exercise['id']
+        return mask
+    
+    def excluded_exercises(self, conditions: tuple) -> int:
+        """Get the bitset over exercise IDs of the exercises any of the normalised conditions rule out"""
+        mask = 0
+        for condition in conditions:
+            mask |= self.contraindication_masks.get(condition, 0)
+        return mask
+    
+    def _adjust_schedule(
+        self,
+        schedule: Dict[str, Any],
+        conditions: tuple
+    ) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        """Replace the contraindicated exercises of a weekly schedule, and list what changed
+        
+        Each one is swapped for its first alternative that is neither ruled out nor
+        already on that day, or dropped when there is none. A day left with no exercises
+        is dropped rather than served empty. The schedule is not modified.
+        """
+        excluded = self.excluded_exercises(conditions)
+        adjusted, adjustments = {}, []
+        for day_name, day_data in schedule.items():
+            scheduled = self._exercise_mask(day_data["exercises"])
+            if not scheduled & excluded:
+                adjusted[day_name] = day_data
+                continue
+            
+            exercises = []
+            for exercise in day_data["exercises"]:
+                if not excluded >> exercise['id'] & 1:
+                    exercises.append(exercise)
+                    continue
+                
+                blocked = excluded | scheduled
+                substitute = next(
+                    (alternative for alternative in self.exercise_alternatives.get(exercise['id'], [])
+                     if not blocked >> alternative['id'] & 1),
+                    None
+                )
+                if substitute is not None:
+                    scheduled |= 1 << substitute['id']
+                    exercises.append(self._substitute_exercise(exercise, substitute))
+                adjustments.append({
+                    "day": day_name,
+                    "exercise": exercise['name'],
+                    "substitute": substitute['name'] if substitute is not None else None,
+                    "conditions": [
+                        condition for condition in conditions
+                        if self.contraindication_masks.get(condition, 0) >> exercise['id'] & 1
+                    ]
+                })
+            if exercises:
+                adjusted[day_name] = {**day_data, "exercises": exercises}
+        
+        return adjusted, adjustments
+    
+    def _substitute_exercise(self, exercise: Dict[str, Any], substitute: CatalogRecord) -> Dict[str, Any]:
+        """Prescribe a substitute with the replaced exercise's dose where it applies
+        
+        The substitute keeps the replaced exercise's values for the fields its own
+        catalog entry prescribes, and its sets, so intervals keep their rounds.
+        """
+        prescription = {
+            field: exercise.get(field, substitute.get(field))
+            for field in PRESCRIPTION_FIELDS
+            if field in substitute or (field == 'sets' and field in exercise)
+        }
+        return {**self._join_exercise({"id": substitute['id'], **prescription}), "replaces": exercise['name']}
+    
     def _generate_recovery_tips(self, goal: str, fitness_level: str) -> List[str]:
         """Generate personalized recovery tips"""
         tips = [
@@ -412,10 +604,7 @@ class WorkoutAIGenerator:
     def _generate_progression_strategy(self, goal: str) -> Dict[str, Any]:
         """Generate progression strategy"""
         return {
-            "week1to2": "Focus on form and establishing baseline",
-            "week3to4": "Increase weight by 5-10% or add 1-2 reps",
-            "week5to6": "Deload week - reduce volume by 40%, maintain intensity",
-            "week7to8": "Final push - attempt new PRs or add extra volume",
+            **{phase: focus for phase, focus, _ in PROGRESSION_PHASES},
             "tips": [
                 "Track your workouts in a notebook or app",
                 "Aim for progressive overload each week",
@@ -426,33 +615,58 @@ class WorkoutAIGenerator:
     
     def _get_medical_considerations(self, user_profile: Dict[str, Any]) -> List[str]:
         """Get medical considerations"""
-        medical_conditions = user_profile.get('medicalConditions', [])
-        considerations = []
-        
-        condition_advice = {
-            'lower_back_pain': "Avoid heavy deadlifts and loaded spinal flexion. Focus on core strengthening. Consult a physical therapist.",
-            'knee_problems': "Modify squats to partial range of motion. Avoid deep lunges. Consider cycling over running.",
-            'shoulder_injury': "Avoid heavy pressing movements. Focus on rotator cuff exercises. Use machines over free weights.",
-            'diabetes': "Stay well-hydrated, monitor energy levels, carry fast-acting carbs during training.",
-            'hypertension': "Avoid isometric holds, focus on moderate intensity, include more cardio.",
-        }
-        
-        for condition in medical_conditions:
-            if condition.lower() in condition_advice:
-                considerations.append(condition_advice[condition.lower()])
+        considerations = [
+            CONDITION_ADVICE[condition]
+            for condition in self._normalize_conditions(user_profile.get('medicalConditions', []))
+        ]
         
         if not considerations:
             considerations.append("Consult with a healthcare provider before starting this program.")
         
         return considerations
     
+    def _normalize_conditions(self, medical_conditions: List[str]) -> tuple:
+        """Get the recognised medical conditions, lowercased, once each, in CONDITION_ADVICE order"""
+        conditions = {condition.lower() for condition in medical_conditions}
+        return tuple(condition for condition in CONDITION_ADVICE if condition in conditions)
+    
+    def plan_cache_key(self, user_profile: Dict[str, Any], start_week: int = 1, weeks: int = PROGRAM_WEEKS) -> tuple:
+        """Get a canonical cache key covering only the profile fields a workout plan depends on"""
+        goal = user_profile.get('goal', 'balanced')
+        return (
+            self._select_template(self._assess_fitness_level(user_profile), goal),
+            goal,
+            self._normalize_conditions(user_profile.get('medicalConditions', [])),
+            start_week,
+            weeks
+        )
+    
+    def generate_plan_payload(
+        self,
+        user_profile: Dict[str, Any],
+        start_week: int = 1,
+        weeks: int = PROGRAM_WEEKS
+    ) -> Dict[str, bytes]:
+        """Generate a workout plan pre-encoded for serving, field by field; render it with render_plan"""
+        workout_plan = self._build_workout_plan(user_profile, start_week, weeks)
+        return {field: encode_json(value) for field, value in workout_plan.items() if field not in WORKOUT_REQUEST_FIELDS}
+    
+    def render_plan(self, payload: Dict[str, bytes], user_profile: Dict[str, Any]) -> bytes:
+        """Encode a plan payload with its timestamp and echoed fitness level set for this request"""
+        return splice_object({
+            **payload,
+            "fitnessLevel": encode_json(self._assess_fitness_level(user_profile)),
+            "generatedAt": encode_json(datetime.now().isoformat())
+        })
+    
+    def find_exercise(self, exercise_name: str) -> Optional[CatalogRecord]:
+        """Look up a catalog exercise by name, ignoring case"""
+        return self.exercise_index.get(exercise_name.casefold())
+    
     def get_exercise_alternatives(self, exercise_name: str) -> List[str]:
         """Get alternative exercises"""
-        for category, exercises in self.exercise_database.items():
-            for ex in exercises:
-                if ex.get('name', '').lower() == exercise_name.lower():
-                    return ex.get('alternatives', [])
-        return []
+        exercise = self.find_exercise(exercise_name)
+        return list(exercise.get('alternatives', [])) if exercise is not None else []
 
 # Initialize generator
 workout_generator = WorkoutAIGenerator()
@@ -50,7 +50,6 @@ const DietPlan: React.FC<DietPlanProps> = ({ userProfile }) => {
         goal: userProfile.goal || 'maintenance',
         medicalConditions: userProfile.medicalConditions || [],
         dietaryRestrictions: userProfile.dietaryRestrictions || [],
-        targetCalories: 2000, // Replace with actual TDEE from calculations
       };
 
       console.log('Sending diet plan request:', requestData);